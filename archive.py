@@ -0,0 +1,165 @@
+"""
+Tiered archive of old squads_states and news rows
+
+Hot DB keeps recent history only: `main.py archive` moves squads_states rows older than ARCHIVE_HORIZON_DAYS and
+news not seen for that long to compressed append-only files in ARCHIVE_DIR, partitioned by table and month:
+    <ARCHIVE_DIR>/squads_states/2021-03.jsonl.gz
+Every migration batch appends one gzip member (json line per row) to every partition it touches and records
+(table, squad_id, file, member offset and length) in archive_index of hot DB, so rows of one squad are read back by
+decompressing only members which have them, see squad_history.
+
+The latest state of every squad and the latest public statement stay in hot DB whatever old they are, hooks, smart
+news and web rely on them.
+
+Migration runs online: every batch is a short transaction submitted to utils.WRITER on its own, pauses between
+batches are out of it, so collector and discord sender can write between batches. The file is written before the
+transaction commits, if it fails the member stays in the file but isn't in the index and never read.
+Deleted rows' pages are reused by new rows, `vacuum` shrinks the file if needed.
+
+`main.py history <squads_states|news> <id>` prints archived rows of a squad.
+"""
+import collections
+import gzip
+import json
+import os
+import sqlite3
+import time
+
+import sql_requests
+import utils
+from EDMCLogging import get_main_logger
+
+logger = get_main_logger()
+
+ARCHIVE_DIR: str = os.getenv('JUBILANT_ARCHIVE_DIR', 'archive')
+ARCHIVE_HORIZON_DAYS: float = float(os.getenv('JUBILANT_ARCHIVE_HORIZON_DAYS', 365))
+ARCHIVE_BATCH_SIZE: int = int(os.getenv('JUBILANT_ARCHIVE_BATCH_SIZE', 10000))
+ARCHIVE_BATCH_PAUSE: float = float(os.getenv('JUBILANT_ARCHIVE_BATCH_PAUSE', 0.1))  # let collector write
+
+logger.debug(f'ARCHIVE_DIR = {ARCHIVE_DIR}, ARCHIVE_HORIZON_DAYS = {ARCHIVE_HORIZON_DAYS}, '
+             f'ARCHIVE_BATCH_SIZE = {ARCHIVE_BATCH_SIZE}, ARCHIVE_BATCH_PAUSE = {ARCHIVE_BATCH_PAUSE}')
+
+# table: (select of rows to archive, delete by rowid)
+ARCHIVED_TABLES: dict[str, tuple[str, str]] = {
+    'squads_states': (sql_requests.select_squad_states_to_archive, sql_requests.delete_squad_states_by_rowid),
+    'news': (sql_requests.select_news_to_archive, sql_requests.delete_news_by_rowid),
+}
+
+
+def _partition(record: dict) -> str:
+    """Month of the row, YYYY-MM"""
+    return (record.get('last_seen') or record['inserted_timestamp'])[:7]
+
+
+def _append_members(table_name: str, records: list[dict]) -> list[tuple]:
+    """Appends records to their partitions, one gzip member per partition
+
+    :param table_name:
+    :param records:
+    :return: archive_index rows
+    """
+
+    partitions: dict[str, list[dict]] = collections.defaultdict(list)
+    for record in records:
+        partitions[_partition(record)].append(record)
+
+    index_rows: list[tuple] = list()
+    for partition, partition_records in partitions.items():
+        archive_file: str = f'{table_name}/{partition}.jsonl.gz'
+        path: str = os.path.join(ARCHIVE_DIR, archive_file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        member: bytes = gzip.compress(
+            ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in partition_records).encode('utf-8'))
+
+        with open(path, 'ab') as archive:
+            offset: int = archive.tell()
+            archive.write(member)
+            archive.flush()
+            os.fsync(archive.fileno())
+
+        for squad_id in sorted({record['squad_id'] for record in partition_records}):
+            index_rows.append((table_name, squad_id, archive_file, offset, len(member)))
+
+    return index_rows
+
+
+def _archive_batch(
+        db_conn: sqlite3.Connection,
+        table_name: str,
+        last_rowid: int,
+        horizon_days: float,
+        batch_size: int) -> tuple[int, int]:
+    """Moves one batch of rows after last_rowid to the archive in one transaction, runs in utils.WRITER thread
+
+    :return: amount of archived rows and rowid of the last one
+    """
+
+    select_query, delete_query = ARCHIVED_TABLES[table_name]
+    utils.DB_WRITER.flush(db_conn)  # commit pending batched writes on their own, not in our transaction
+    with db_conn:
+        cursor: sqlite3.Cursor = db_conn.execute(select_query, (last_rowid, f'-{horizon_days} days', batch_size))
+        columns: list[str] = [description[0] for description in cursor.description][1:]  # without rowid
+        rows: list[tuple] = cursor.fetchall()
+        if len(rows) == 0:
+            return 0, last_rowid
+
+        index_rows: list[tuple] = _append_members(table_name, [dict(zip(columns, row[1:])) for row in rows])
+        db_conn.executemany(sql_requests.insert_archive_index, index_rows)
+        db_conn.executemany(delete_query, [(row[0],) for row in rows])
+
+    return len(rows), rows[-1][0]
+
+
+def archive_table(
+        db_conn: sqlite3.Connection,
+        table_name: str,
+        horizon_days: float = ARCHIVE_HORIZON_DAYS,
+        batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Moves rows of the table older than horizon to the archive
+
+    :param db_conn:
+    :param table_name: one of ARCHIVED_TABLES
+    :param horizon_days:
+    :param batch_size: rows per transaction
+    :return: amount of archived rows
+    """
+
+    archived: int = 0
+    last_rowid: int = 0
+
+    while True:
+        batch_rows, last_rowid = utils.WRITER.call(
+            _archive_batch, db_conn, table_name, last_rowid, horizon_days, batch_size)
+        if batch_rows == 0:
+            break
+
+        archived += batch_rows
+        logger.info(f'Archived {archived} rows of {table_name}')
+        time.sleep(ARCHIVE_BATCH_PAUSE)
+
+    return archived
+
+
+def squad_history(db_conn: sqlite3.Connection, table_name: str, squad_id: int) -> list[dict]:
+    """Archived rows of the squad, oldest partitions first
+
+    :param db_conn:
+    :param table_name: one of ARCHIVED_TABLES
+    :param squad_id:
+    :return: rows as column: value dicts
+    """
+
+    records: list[dict] = list()
+    for archive_file, offset, length in utils.fetch_all(
+            db_conn, sql_requests.select_archive_members, (table_name, squad_id)):
+        with open(os.path.join(ARCHIVE_DIR, archive_file), 'rb') as archive:
+            archive.seek(offset)
+            member: bytes = archive.read(length)
+
+        for line in gzip.decompress(member).decode('utf-8').splitlines():
+            record: dict = json.loads(line)
+            if record['squad_id'] == squad_id:
+                records.append(record)
+
+    return records
@@ -0,0 +1,123 @@
+"""
+Cache of bearer tokens for FAPI requests
+
+Holds small pool of tokens and rotates them. Tokens which are close to their TTL are replaced by background
+thread, old token stays in use until replacement obtained, so slow or dead capi.demb.design doesn't stop collector.
+Token is dropped immediately only if FAPI rejected it (401/403), see BearerCache.invalidate.
+"""
+import os
+import threading
+import time
+import typing
+
+from EDMCLogging import get_main_logger
+
+logger = get_main_logger()
+
+BEARER_POOL_SIZE: int = int(os.getenv('JUBILANT_BEARER_POOL_SIZE', 3))
+BEARER_TTL: float = float(os.getenv('JUBILANT_BEARER_TTL', 30 * 60))
+BEARER_REFRESH_AHEAD: float = float(os.getenv('JUBILANT_BEARER_REFRESH_AHEAD', 5 * 60))
+
+logger.debug(f'BEARER_POOL_SIZE = {BEARER_POOL_SIZE}, BEARER_TTL = {BEARER_TTL}, '
+             f'BEARER_REFRESH_AHEAD = {BEARER_REFRESH_AHEAD}')
+
+
+class BearerCache:
+    def __init__(
+            self,
+            fetcher: typing.Callable[[], str],
+            pool_size: int = BEARER_POOL_SIZE,
+            ttl: float = BEARER_TTL,
+            refresh_ahead: float = BEARER_REFRESH_AHEAD):
+        """
+        :param fetcher: callable which requests new token, i.e. utils._get_bearer
+        :param pool_size: how many tokens to rotate
+        :param ttl: how long we consider token as fresh
+        :param refresh_ahead: how long before ttl background thread starts to look for replacement
+        """
+
+        self.fetcher = fetcher
+        self.pool_size = pool_size
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+
+        self._tokens: list[list] = list()  # [token, expires_at]
+        self._next: int = 0
+        self._lock = threading.Lock()
+        self._refresher: typing.Optional[threading.Thread] = None
+        self._wakeup = threading.Event()
+
+    def get(self) -> str:
+        """Returns one of cached tokens in round robin manner, blocks on fetching only if pool is empty
+
+        :return: bearer token
+        """
+
+        self._ensure_refresher()
+
+        with self._lock:
+            if len(self._tokens) != 0:
+                self._next = (self._next + 1) % len(self._tokens)
+                return self._tokens[self._next][0]
+
+        token = self.fetcher()
+        with self._lock:
+            self._add(token)
+
+        self._wakeup.set()  # let refresher fill the rest of pool
+        return token
+
+    def invalidate(self, token: str) -> None:
+        """Drops token from pool, call it when FAPI rejected token
+
+        :param token: token which was rejected
+        :return:
+        """
+
+        with self._lock:
+            self._tokens = [entry for entry in self._tokens if entry[0] != token]
+
+        logger.info(f'Bearer token invalidated, {len(self._tokens)} left in pool')
+        self._wakeup.set()
+
+    def _add(self, token: str) -> None:
+        # must be called under lock
+        if token not in [entry[0] for entry in self._tokens]:
+            self._tokens.append([token, time.time() + self.ttl])
+
+    def _ensure_refresher(self) -> None:
+        with self._lock:
+            if self._refresher is None:
+                self._refresher = threading.Thread(target=self._refresh_loop, name='bearer-refresher', daemon=True)
+                self._refresher.start()
+
+    def _refresh_loop(self) -> None:
+        while True:
+            try:
+                self._refresh()
+
+            except Exception as e:
+                logger.warning('Failed to refresh bearer tokens, keep using cached ones', exc_info=e)
+
+            self._wakeup.wait(timeout=max(self.refresh_ahead / 2, 1))
+            self._wakeup.clear()
+
+    def _refresh(self) -> None:
+        with self._lock:
+            missing: int = self.pool_size - len(self._tokens)
+            expiring: list[str] = [
+                entry[0] for entry in self._tokens if entry[1] - self.refresh_ahead <= time.time()
+            ]
+
+        for _ in range(missing):
+            token = self.fetcher()
+            with self._lock:
+                if len(self._tokens) < self.pool_size:  # get() could already fill it
+                    self._add(token)
+
+        for old_token in expiring:
+            new_token = self.fetcher()
+            with self._lock:
+                # replace, not just drop, old token, so pool never gets empty because of ttl
+                self._tokens = [entry for entry in self._tokens if entry[0] != old_token]
+                self._add(new_token)
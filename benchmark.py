@@ -0,0 +1,145 @@
+"""
+End-to-end collector benchmark against fake_fapi.py
+
+Starts fake FAPI in-process, points jubilant to it and to a temporary DB and runs main.py modes:
+    discover - discovers the whole fake population starting from an empty DB
+    update - updates `--update-amount` squads from the discovered DB
+
+For every mode it reports wall time, squads (processed ids) per second, FAPI requests, time spent in DB writes
+(utils.store_squad_info without hooks) and in hooks and count of commits of squad writes.
+Discord notifications are delivered by utils.DISCORD_SENDER, so `discord` counts webhook posts of coalesced messages.
+
+Usage:
+    python benchmark.py [--population 1000] [--latency 0.05] [--cooldown 0] [--update-amount 500] [fake_fapi args]
+
+Collector related envs (JUBILANT_ASYNC_COLLECTOR, JUBILANT_SMART_NEWS, proxies.json, ...) are used as usual,
+JUBILANT_TIME_BETWEEN_REQUESTS is set from --cooldown.
+"""
+import argparse
+import atexit
+import os
+import tempfile
+import threading
+import time
+
+import fake_fapi
+
+DISCOVER_FIRST_ID: int = 70000  # greater than 65000, so discover uses on time tries limit
+
+
+class Stopwatch:
+    """Accumulates time spent in wrapped function, thread safe"""
+
+    def __init__(self):
+        self.calls: int = 0
+        self.total: float = 0.0
+        self._lock = threading.Lock()
+
+    def wrap(self, function: callable) -> callable:
+        def wrapped(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+
+            finally:
+                with self._lock:
+                    self.calls += 1
+                    self.total += time.perf_counter() - start
+
+        return wrapped
+
+
+def run_mode(name: str, mode: callable, fake: fake_fapi.FakeFAPI) -> dict:
+    import hooks
+    import utils
+
+    store, hook = Stopwatch(), Stopwatch()
+    original_store, original_hook = utils.store_squad_info, hooks.notify_insert_data
+    utils.store_squad_info, hooks.notify_insert_data = store.wrap(original_store), hook.wrap(original_hook)
+    counters_before: dict[str, int] = dict(fake.counters)
+    commits_before: int = utils.DB_WRITER.commits
+
+    start = time.perf_counter()
+    try:
+        mode()
+
+    finally:
+        wall: float = time.perf_counter() - start
+        utils.store_squad_info, hooks.notify_insert_data = original_store, original_hook
+
+    utils.DISCORD_SENDER.drain(timeout=30)  # notifications are delivered in background, wait for them before counting
+
+    return {
+        'mode': name,
+        'squads': store.calls,
+        'wall': wall,
+        'squads_per_second': store.calls / wall if wall > 0 else 0.0,
+        'db_write': store.total - hook.total,
+        'hooks': hook.total,
+        'commits': utils.DB_WRITER.commits - commits_before,
+        **{counter: fake.counters[counter] - counters_before[counter] for counter in fake.counters}
+    }
+
+
+def print_report(results: list[dict]) -> None:
+    print(f'{"mode":<10}{"squads":>8}{"wall, s":>10}{"squads/s":>10}{"db write, s":>13}{"hooks, s":>10}{"commits":>9}'
+          f'{"info":>7}{"news":>7}{"418":>6}{"discord":>9}')
+
+    for result in results:
+        print(f'{result["mode"]:<10}{result["squads"]:>8}{result["wall"]:>10.2f}{result["squads_per_second"]:>10.2f}'
+              f'{result["db_write"]:>13.3f}{result["hooks"]:>10.3f}{result["commits"]:>9}'
+              f'{result["info"]:>7}{result["news"]:>7}'
+              f'{result["maintenance"]:>6}{result["discord"]:>9}')
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description='Collector benchmark against fake FAPI')
+    fake_fapi.add_arguments(arg_parser)
+    arg_parser.set_defaults(first_id=DISCOVER_FIRST_ID)
+    arg_parser.add_argument('--cooldown', type=float, default=0.0, help='JUBILANT_TIME_BETWEEN_REQUESTS')
+    arg_parser.add_argument('--update-amount', type=int, default=500, help='squads to update in update mode')
+    arg_parser.add_argument('--modes', default='discover,update', help='comma separated modes to run')
+    arguments = arg_parser.parse_args()
+
+    fake = fake_fapi.from_arguments(arguments)
+    base_url: str = fake.start()
+
+    db_dir = tempfile.TemporaryDirectory(prefix='jubilant_benchmark_')
+
+    # must be set before importing main and utils
+    os.environ.update({
+        'JUBILANT_FAPI_BASE_URL': f'{base_url}squadron/',
+        'JUBILANT_TOKEN_URL': f'{base_url}random_token',
+        'DEMB_CAPI_AUTH': 'benchmark',
+        'DISCORD_NOTIFICATIONS_HOOK': f'{base_url}discord',
+        'JUBILANT_TIME_BETWEEN_REQUESTS': str(arguments.cooldown),
+        'SQLITE_DB': os.path.join(db_dir.name, 'squads.sqlite'),
+    })
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    import main as jubilant
+    import utils
+
+    # discover starts from the first hole after the smallest known id, so make first id of population the hole
+    utils.properly_delete_squadron(fake.first_id - 1, jubilant.db)
+
+    modes: dict[str, callable] = {
+        'discover': lambda: jubilant.discover(),
+        'update': lambda: jubilant.update(amount_to_update=arguments.update_amount),
+    }
+
+    results: list[dict] = list()
+    for mode_name in arguments.modes.split(','):
+        results.append(run_mode(mode_name, modes[mode_name], fake))
+
+    fake.stop()
+    utils.WRITER.call(utils.DB_WRITER.flush, jubilant.db)
+    atexit.unregister(utils.WRITER.call)
+    jubilant.db.close()
+    db_dir.cleanup()
+
+    print_report(results)
+
+
+if __name__ == '__main__':
+    main()
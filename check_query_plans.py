@@ -0,0 +1,137 @@
+"""
+Query plan regression check for sql_requests.py and model/sqlite_sql_requests.py
+
+Builds a synthetic DB from sql_schema.sql (plus news indexes of utils.prepare_news_storage), runs every select,
+update and delete query of both modules on it and checks `explain query plan` of it: a query fails if it scans
+a table without index or sorts with temp B-tree. Queries which can't do better are listed in EXEMPT with a reason.
+
+Usage:
+    python check_query_plans.py [-v]
+
+exit code is 1 if any query failed, so it can be used in CI
+"""
+import re
+import sqlite3
+import sys
+import types
+from typing import Union
+
+import sql_requests
+from model import sqlite_sql_requests
+
+EXEMPT: dict[str, str] = {
+    'squads_by_tag_pattern_extended_raw_keys': "substring search (like '%tag%') can't use B-tree index",
+    'check_news_unique_index': 'sqlite_master is tiny',
+    'select_squads_states_type': 'sqlite_master is tiny',
+    'check_legacy_squads_states': 'sqlite_master is tiny',
+    'select_discord_outbox': 'head of the queue in rowid order, stops after limit',
+}
+
+SYNTHETIC_SQUADS: int = 2000
+SYNTHETIC_STATES_PER_SQUAD: int = 3
+
+_CHECKED_STATEMENT = re.compile(r'^\s*(select|update|delete|with)\b', re.IGNORECASE)
+_FULL_SCAN = re.compile(r'^SCAN (\w+)$')  # `SCAN table USING INDEX` is index access, bare `SCAN table` isn't
+_NAMED_PARAMETER = re.compile(r':(\w+)')
+
+
+def make_synthetic_db() -> sqlite3.Connection:
+    db_conn = sqlite3.connect(':memory:')
+    with open('sql_schema.sql', 'r', encoding='utf-8') as schema_file:
+        db_conn.executescript(schema_file.read())
+
+    db_conn.executescript(sql_requests.create_news_indexes)
+    db_conn.execute(sql_requests.create_news_unique_index)
+    db_conn.create_function('null_fdev', 1, lambda value: value, deterministic=True)
+
+    state_columns_count: int = len(sql_requests.SQUAD_STATE_COLUMNS)
+    with db_conn:
+        for squad_id in range(1, SYNTHETIC_SQUADS + 1):
+            if squad_id % 10 == 0:
+                db_conn.execute(sql_requests.properly_delete_squad, (squad_id,))
+                continue
+
+            for state in range(SYNTHETIC_STATES_PER_SQUAD):
+                row: list = [squad_id, f'SQUAD {squad_id}', f'T{squad_id % 500}'] + [state] * (state_columns_count - 3)
+                db_conn.execute(sql_requests.insert_squad_states, row)
+
+            db_conn.execute(
+                sql_requests.upsert_news,
+                (squad_id, 'public_statements', squad_id, squad_id, 'Squadrons_History_Category_PublicStatement',
+                 None, None, None, f'motd {squad_id}', f'CMDR {squad_id}', squad_id, squad_id)
+            )
+
+    return db_conn
+
+
+def collect_queries() -> dict[str, str]:
+    queries: dict[str, str] = dict()
+    module: types.ModuleType
+    for module in (sql_requests, sqlite_sql_requests):
+        for name, value in vars(module).items():
+            if name.startswith('_') or not isinstance(value, str) or not _CHECKED_STATEMENT.match(value):
+                continue
+
+            queries[f'{module.__name__}.{name}'] = value
+
+    return queries
+
+
+def parameters_for(query: str) -> Union[dict, tuple]:
+    named: list[str] = _NAMED_PARAMETER.findall(query)
+    if len(named) != 0:
+        return {name: 1 for name in named}
+
+    return (1,) * query.count('?')
+
+
+def check_query(db_conn: sqlite3.Connection, query: str) -> tuple[list[str], list[str]]:
+    """
+    :param db_conn:
+    :param query:
+    :return: plan lines and problems found in them
+    """
+
+    plan: list[str] = [row[3] for row in db_conn.execute(f'explain query plan {query}', parameters_for(query))]
+    problems: list[str] = list()
+
+    for line in plan:
+        if _FULL_SCAN.match(line):
+            problems.append(f'full scan: {line}')
+
+        elif 'USE TEMP B-TREE' in line:
+            problems.append(f'temp B-tree: {line}')
+
+    return plan, problems
+
+
+def main() -> int:
+    verbose: bool = '-v' in sys.argv
+    db_conn = make_synthetic_db()
+    failed: int = 0
+
+    for full_name, query in collect_queries().items():
+        name: str = full_name.split('.')[-1]
+        plan, problems = check_query(db_conn, query)
+
+        if name in EXEMPT:
+            status = f'exempt ({EXEMPT[name]})'
+
+        elif len(problems) != 0:
+            status = 'FAIL'
+            failed += 1
+
+        else:
+            status = 'ok'
+
+        print(f'{full_name}: {status}')
+        if verbose or status == 'FAIL':
+            for line in plan:
+                print(f'    {line}')
+
+    print(f'{failed} queries failed')
+    return int(failed != 0)
+
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,121 @@
+"""
+Maintenance-aware circuit breaker for FAPI
+
+When FAPI answers 418 (maintenance), utils.proxied_request opens the circuit. While it's open every request of every
+worker waits in MaintenanceCircuitBreaker.wait_closed instead of sending useless requests. One of waiting threads
+at a time sends a single cheap probe request, intervals between probes grow from MAINTENANCE_PROBE_INTERVAL up to
+MAINTENANCE_MAX_PROBE_INTERVAL. Once probe passes, the circuit closes and all paused requests continue.
+
+If MAINTENANCE_MAX_WAIT is set (seconds, 0 means wait forever) or abort() was called (i.e. on shutdown), waiting
+requests raise utils.FAPIDownForMaintenance, as they did before the circuit breaker. MAINTENANCE_MAX_WAIT limits
+waiting of every call, not the maintenance: the circuit stays open and later calls keep probing until FAPI is back.
+"""
+import os
+import threading
+import time
+import typing
+
+from EDMCLogging import get_main_logger
+
+logger = get_main_logger()
+
+MAINTENANCE_PROBE_INTERVAL: float = float(os.getenv('JUBILANT_MAINTENANCE_PROBE_INTERVAL', 30))
+MAINTENANCE_MAX_PROBE_INTERVAL: float = float(os.getenv('JUBILANT_MAINTENANCE_MAX_PROBE_INTERVAL', 15 * 60))
+MAINTENANCE_MAX_WAIT: float = float(os.getenv('JUBILANT_MAINTENANCE_MAX_WAIT', 0))
+
+logger.debug(f'MAINTENANCE_PROBE_INTERVAL = {MAINTENANCE_PROBE_INTERVAL}, MAINTENANCE_MAX_PROBE_INTERVAL = '
+             f'{MAINTENANCE_MAX_PROBE_INTERVAL}, MAINTENANCE_MAX_WAIT = {MAINTENANCE_MAX_WAIT}')
+
+
+class CircuitOpen(Exception):
+    """Circuit is open for too long or aborted"""
+    pass
+
+
+class MaintenanceCircuitBreaker:
+    def __init__(self, probe: typing.Callable[[], bool]):
+        """
+        :param probe: sends one cheap request bypassing the breaker, returns True if FAPI isn't on maintenance anymore
+        """
+
+        self.probe = probe
+        self.is_open: bool = False
+        self.opened_at: float = 0.0
+        self.aborted: bool = False
+
+        self._probe_interval: float = MAINTENANCE_PROBE_INTERVAL
+        self._next_probe: float = 0.0
+        self._probing: bool = False
+        self._condition = threading.Condition()
+
+    def trip(self) -> None:
+        """Opens the circuit, call it on 418"""
+
+        with self._condition:
+            if self.is_open:
+                return
+
+            logger.warning(f'FAPI is on maintenance, pausing all requests, first probe in {self._probe_interval} s')
+            self.is_open = True
+            self.opened_at = time.time()
+            self._next_probe = self.opened_at + self._probe_interval
+
+    def abort(self) -> None:
+        """Makes waiting requests raise instead of waiting, safe to call from signal handler"""
+        self.aborted = True
+
+    def wait_closed(self) -> None:
+        """Returns immediately if circuit is closed, otherwise blocks until FAPI is back, probing it meanwhile
+
+        :raises CircuitOpen: if waiting is aborted or this call waits longer than MAINTENANCE_MAX_WAIT
+        :return:
+        """
+
+        if not self.is_open:
+            return
+
+        wait_started: float = time.time()
+        with self._condition:
+            while self.is_open:
+                if self.aborted:
+                    raise CircuitOpen('Waiting for the end of maintenance aborted')
+
+                # probe first, so the circuit can close even if every caller gives up on MAINTENANCE_MAX_WAIT
+                if not self._probing and time.time() >= self._next_probe:
+                    self._probing = True
+                    self._condition.release()
+                    try:
+                        passed: bool = self._safe_probe()
+
+                    finally:
+                        self._condition.acquire()
+                        self._probing = False
+
+                    self._on_probe_result(passed)
+                    continue
+
+                if MAINTENANCE_MAX_WAIT > 0 and time.time() - wait_started > MAINTENANCE_MAX_WAIT:
+                    raise CircuitOpen(f'FAPI is on maintenance, waited for more than {MAINTENANCE_MAX_WAIT} s')
+
+                self._condition.wait(timeout=1)  # wake up every second to notice abort and time to probe
+
+    def _safe_probe(self) -> bool:
+        try:
+            return self.probe()
+
+        except Exception as e:
+            logger.warning(f'Maintenance probe failed: {e.__class__.__name__}: {e}')
+            return False
+
+    def _on_probe_result(self, passed: bool) -> None:
+        # must be called under lock
+        if passed:
+            logger.info(f'FAPI is back after {time.time() - self.opened_at:.0f} s of maintenance, resuming requests')
+            self.is_open = False
+            self._probe_interval = MAINTENANCE_PROBE_INTERVAL
+            self._condition.notify_all()
+
+        else:
+            self._probe_interval = min(self._probe_interval * 2, MAINTENANCE_MAX_PROBE_INTERVAL)
+            self._next_probe = time.time() + self._probe_interval
+            logger.info(f'FAPI is still on maintenance, next probe in {self._probe_interval} s')
@@ -0,0 +1,176 @@
+"""
+Asyncio collector engine
+
+Every proxy from utils.PROXIES_DICT gets its own worker, workers pull squad ids from one shared queue.
+Network stage (utils.fetch_squad_info) is blocking (requests), so it runs in a thread pool with one thread per
+proxy. Workers aren't pinned to proxies: utils.PROXY_SCHEDULER hands every request the earliest eligible proxy, so
+per proxy kd is still respected and worker doesn't stuck on a dead proxy.
+DB stage (utils.store_squad_info, hooks included) and DB reads of workers run in utils.WRITER thread, so event loop
+isn't blocked by sqlite and connection isn't used by two threads at once. Writes keep their order within a worker.
+
+collect takes a fixed list of ids (update), collect_stream takes ids one by one from a callback and delivers results
+in the order of ids (discover, where the next id depends on results of the previous ones).
+
+Enables by JUBILANT_ASYNC_COLLECTOR=true env
+"""
+import asyncio
+import collections
+import concurrent.futures
+import os
+import sqlite3
+import typing
+from typing import Union
+
+import utils
+from EDMCLogging import get_main_logger
+
+logger = get_main_logger()
+
+ASYNC_COLLECTOR: bool = os.getenv('JUBILANT_ASYNC_COLLECTOR', 'false').lower() == 'true'
+
+logger.debug(f'ASYNC_COLLECTOR = {ASYNC_COLLECTOR}')
+
+
+async def _update(
+        squad_id: int,
+        executor: concurrent.futures.Executor,
+        db_conn: sqlite3.Connection,
+        suppress_absence: bool) -> Union[bool, dict]:
+    loop = asyncio.get_running_loop()
+
+    if await asyncio.wrap_future(utils.WRITER.submit(utils.is_squad_properly_deleted, squad_id, db_conn)):
+        logger.debug(f'squad {squad_id} is marked as deleted in our DB, skipping')
+        return False
+
+    previous_state = await asyncio.wrap_future(
+        utils.WRITER.submit(utils.get_smart_news_state, squad_id, db_conn))
+    squad_request, news_request = await loop.run_in_executor(
+        executor, utils.fetch_squad_info, squad_id, None, not suppress_absence, previous_state)
+    return await asyncio.wrap_future(utils.WRITER.submit(
+        utils.store_squad_info, squad_id, squad_request, news_request, db_conn, suppress_absence))
+
+
+async def _worker(
+        queue: asyncio.Queue,
+        executor: concurrent.futures.Executor,
+        db_conn: sqlite3.Connection,
+        suppress_absence: bool,
+        should_stop: typing.Callable[[], bool],
+        results: dict[int, Union[bool, dict]]) -> None:
+
+    while not queue.empty() and not should_stop():
+        squad_id: int = queue.get_nowait()
+        results[squad_id] = await _update(squad_id, executor, db_conn, suppress_absence)
+
+
+async def _collect(
+        squad_ids: typing.Iterable[int],
+        db_conn: sqlite3.Connection,
+        suppress_absence: bool,
+        should_stop: typing.Callable[[], bool]) -> dict[int, Union[bool, dict]]:
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for squad_id in squad_ids:
+        queue.put_nowait(squad_id)
+
+    results: dict[int, Union[bool, dict]] = dict()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(utils.PROXIES_DICT)) as executor:
+        workers = [
+            asyncio.create_task(_worker(queue, executor, db_conn, suppress_absence, should_stop, results))
+            for _ in utils.PROXIES_DICT
+        ]
+
+        try:
+            await asyncio.gather(*workers)
+
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    return results
+
+
+async def _collect_stream(
+        next_id: typing.Callable[[int], Union[int, None]],
+        on_result: typing.Callable[[int, Union[bool, dict]], None],
+        db_conn: sqlite3.Connection,
+        suppress_absence: bool,
+        should_stop: typing.Callable[[], bool]) -> None:
+
+    in_flight: collections.deque[int] = collections.deque()  # taken ids in order, results are delivered in it
+    ready: dict[int, Union[bool, dict]] = dict()
+    delivered = asyncio.Condition()
+
+    async def stream_worker(executor: concurrent.futures.Executor) -> None:
+        while True:
+            squad_id: Union[int, None] = None if should_stop() else next_id(len(in_flight))
+            if squad_id is None:
+                if len(in_flight) == 0:
+                    return
+
+                async with delivered:  # results in flight may let next_id give more ids
+                    await delivered.wait()
+
+                continue
+
+            in_flight.append(squad_id)
+            ready[squad_id] = await _update(squad_id, executor, db_conn, suppress_absence)
+
+            async with delivered:
+                while len(in_flight) != 0 and in_flight[0] in ready:
+                    done_id: int = in_flight.popleft()
+                    on_result(done_id, ready.pop(done_id))
+
+                delivered.notify_all()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(utils.PROXIES_DICT)) as executor:
+        workers = [asyncio.create_task(stream_worker(executor)) for _ in utils.PROXIES_DICT]
+
+        try:
+            await asyncio.gather(*workers)
+
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+
+def collect(
+        squad_ids: typing.Iterable[int],
+        db_conn: sqlite3.Connection,
+        suppress_absence: bool = False,
+        should_stop: typing.Callable[[], bool] = lambda: False) -> dict[int, Union[bool, dict]]:
+    """Updates squads with specified ids concurrently, one worker per proxy
+
+    :param squad_ids: ids of squads to update
+    :param db_conn: connection to sqlite DB
+    :param suppress_absence: the same as for utils.update_squad_info
+    :param should_stop: callable, workers don't take new ids once it returns True
+    :return: dict squad_id: result of utils.update_squad_info for every processed id
+    """
+
+    return asyncio.run(_collect(squad_ids, db_conn, suppress_absence, should_stop))
+
+
+def collect_stream(
+        next_id: typing.Callable[[int], Union[int, None]],
+        on_result: typing.Callable[[int, Union[bool, dict]], None],
+        db_conn: sqlite3.Connection,
+        suppress_absence: bool = False,
+        should_stop: typing.Callable[[], bool] = lambda: False) -> None:
+    """Updates squads concurrently taking ids one by one, so workers stay busy for the whole run, i.e. discover
+
+    Results are passed to on_result in order of ids taken, so on_result sees the same sequence as a serial loop.
+    Once should_stop returns True or next_id returns None with nothing in flight, workers finish and results of
+    all taken ids are delivered
+
+    :param next_id: callable, gets count of ids in flight (taken, but not passed to on_result yet) and returns the
+    next id to update or None to wait for results in flight, and to stop if there are none
+    :param on_result: callable, gets squad id and result of utils.update_squad_info for it
+    :param db_conn: connection to sqlite DB
+    :param suppress_absence: the same as for utils.update_squad_info
+    :param should_stop: callable, workers don't take new ids once it returns True
+    :return:
+    """
+
+    asyncio.run(_collect_stream(next_id, on_result, db_conn, suppress_absence, should_stop))
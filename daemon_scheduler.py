@@ -0,0 +1,187 @@
+"""
+Continuous daemon scheduler
+
+Instead of "update 500 squads, sleep 30 min, discover, sleep 30 min" daemon runs continuously and spends a fixed
+budget of FAPI requests per hour per proxy. Work of all types lives in one priority queue (heapq):
+    refresh - squads which are due (see refresh_scheduler.py), in due order
+    discover - probing ids after the last known one, paused for DISCOVER_PAUSE after TRIES_LIMIT_ON_THE_TIME misses
+    backcheck - rechecking the newest squads
+Every type has a share of the budget, items get queue keys by weighted fair queuing: every enqueued item of a type
+moves type's virtual clock by 1 / share, so popping the queue interleaves types in proportion of their shares.
+A type without pending work isn't in the queue, so its share goes to the others, i.e. while no squad is due for
+refresh the whole budget goes to discover and backcheck.
+"""
+import heapq
+import itertools
+import os
+import sqlite3
+import time
+import typing
+
+import sql_requests
+import utils
+from EDMCLogging import get_main_logger
+
+logger = get_main_logger()
+
+DAEMON_REQUESTS_PER_HOUR: float = float(os.getenv('JUBILANT_DAEMON_REQUESTS_PER_HOUR', 600))  # per proxy
+DAEMON_SHARES: dict[str, float] = {
+    kind: float(share) for kind, share in (
+        pair.split('=') for pair in os.getenv(
+            'JUBILANT_DAEMON_SHARES', 'refresh=0.7,discover=0.2,backcheck=0.1').split(',')
+    )
+}
+DAEMON_WORK_KINDS: tuple = ('refresh', 'discover', 'backcheck')
+if not set(DAEMON_SHARES).issubset(DAEMON_WORK_KINDS):
+    raise ValueError(f'Unknown work kinds in JUBILANT_DAEMON_SHARES: '
+                     f'{", ".join(sorted(set(DAEMON_SHARES) - set(DAEMON_WORK_KINDS)))}, '
+                     f'expected some of {", ".join(DAEMON_WORK_KINDS)}')
+
+DAEMON_BACK_COUNT: int = int(os.getenv('JUBILANT_DAEMON_BACK_COUNT', 20))
+DISCOVER_PAUSE: float = float(os.getenv('JUBILANT_DISCOVER_PAUSE', 5 * 60))
+TRIES_LIMIT_ON_THE_TIME: int = 5
+REFRESH_BATCH: int = 100
+
+logger.debug(f'DAEMON_REQUESTS_PER_HOUR = {DAEMON_REQUESTS_PER_HOUR}, DAEMON_SHARES = {DAEMON_SHARES}, '
+             f'DAEMON_BACK_COUNT = {DAEMON_BACK_COUNT}, DISCOVER_PAUSE = {DISCOVER_PAUSE}')
+
+
+class DaemonScheduler:
+    def __init__(self, db_conn: sqlite3.Connection, shares: dict[str, float] = None, requests_per_hour: float = None):
+        """
+        :param db_conn:
+        :param shares: kind of work: share of budget, DAEMON_SHARES by default
+        :param requests_per_hour: budget for all proxies, DAEMON_REQUESTS_PER_HOUR * proxies count by default
+        """
+
+        self.db_conn = db_conn
+        self.shares: dict[str, float] = {kind: share for kind, share in (shares or DAEMON_SHARES).items() if share > 0}
+        if requests_per_hour is None:
+            requests_per_hour = DAEMON_REQUESTS_PER_HOUR * len(utils.PROXIES_DICT)
+
+        self.rate: float = requests_per_hour / 3600  # requests per second
+        self.tokens: float = 0.0  # token bucket, never more than one second of budget in reserve
+        self.tokens_updated: float = time.monotonic()
+
+        self._queue: list[tuple[float, int, str, int]] = list()  # (virtual time, seq, kind, squad_id)
+        self._counter = itertools.count()
+        self._virtual_time: dict[str, float] = {kind: 0.0 for kind in self.shares}
+        self._queued: dict[str, set[int]] = {kind: set() for kind in self.shares}
+
+        # discover state
+        self.discover_cursor: int = utils.get_last_known_id(db_conn)
+        self.discover_tries: int = 0
+        self.discover_failed: list[int] = list()
+        self.discover_paused_until: float = 0.0
+
+    def push(self, kind: str, squad_id: int) -> None:
+        if squad_id in self._queued[kind]:
+            return
+
+        # virtual time of a kind never lags behind the queue, otherwise idle kind would burst after refill
+        now_virtual: float = self._queue[0][0] if len(self._queue) != 0 else 0.0
+        self._virtual_time[kind] = max(self._virtual_time[kind], now_virtual) + 1 / self.shares[kind]
+        heapq.heappush(self._queue, (self._virtual_time[kind], next(self._counter), kind, squad_id))
+        self._queued[kind].add(squad_id)
+
+    def refill(self) -> None:
+        """Tops up work of every kind which has no pending items"""
+
+        if 'refresh' in self.shares and len(self._queued['refresh']) == 0:
+            for row in utils.fetch_all(self.db_conn, sql_requests.select_due_squads_to_update, (REFRESH_BATCH,)):
+                self.push('refresh', row[0])
+
+        if 'backcheck' in self.shares and len(self._queued['backcheck']) == 0:
+            for row in utils.fetch_all(self.db_conn, sql_requests.select_new_squads_to_update, (DAEMON_BACK_COUNT,)):
+                self.push('backcheck', row[0])
+
+        if 'discover' in self.shares and len(self._queued['discover']) == 0 \
+                and time.time() >= self.discover_paused_until:
+            self.push('discover', self.discover_cursor + 1)  # discover is sequential, one id at a time
+
+    def pop(self) -> typing.Union[tuple[str, int], None]:
+        if len(self._queue) == 0:
+            return None
+
+        _, _, kind, squad_id = heapq.heappop(self._queue)
+        self._queued[kind].discard(squad_id)
+        return kind, squad_id
+
+    def wait_for_budget(self, should_stop: typing.Callable[[], bool]) -> None:
+        while not should_stop():
+            now = time.monotonic()
+            self.tokens = min(self.tokens + (now - self.tokens_updated) * self.rate, max(self.rate, 1))
+            self.tokens_updated = now
+
+            if self.tokens >= 1:
+                return
+
+            time.sleep(min((1 - self.tokens) / self.rate, 1))  # wake up at least every second to check should_stop
+
+    def process(self, kind: str, squad_id: int) -> None:
+        if kind == 'discover':
+            self._process_discover(squad_id)
+
+        else:
+            logger.info(f'Updating {squad_id} ID ({kind})')
+            utils.update_squad_info(squad_id, self.db_conn)
+
+    def _process_discover(self, squad_id: int) -> None:
+        squad_info = utils.update_squad_info(squad_id, self.db_conn, suppress_absence=True)
+        self.discover_cursor = squad_id
+
+        if isinstance(squad_info, dict):  # success
+            logger.debug(f'Success discover for {squad_id} ID')
+            self.discover_tries = 0
+
+            for failed_squad in self.discover_failed:  # since we found an exists squad, previous failed don't exist
+                utils.properly_delete_squadron(failed_squad, self.db_conn)
+
+            self.discover_failed = list()
+
+        else:
+            logger.debug(f'Fail on discovery for {squad_id} ID')
+            self.discover_failed.append(squad_id)
+            self.discover_tries += 1
+
+            if self.discover_tries >= TRIES_LIMIT_ON_THE_TIME:
+                # looks like we reached the newest squad, come back to the last found one later
+                logger.debug(f'Pausing discover for {DISCOVER_PAUSE} s')
+                self.discover_cursor = squad_id - self.discover_tries
+                self.discover_tries = 0
+                self.discover_failed = list()
+                self.discover_paused_until = time.time() + DISCOVER_PAUSE
+
+    def run(self, should_stop: typing.Callable[[], bool]) -> None:
+        """Runs until should_stop returns True
+
+        :param should_stop:
+        :return:
+        """
+
+        logger.info(f'Daemon scheduler started, budget {self.rate * 3600:.0f} requests/hour, shares: {self.shares}')
+
+        while not should_stop():
+            self.refill()
+            work = self.pop()
+
+            if work is None:  # nothing to do, i.e. empty DB and discover paused
+                utils.WRITER.call(utils.DB_WRITER.flush, self.db_conn)
+                time.sleep(1)
+                continue
+
+            utils.WRITER.call(utils.DB_WRITER.commit_if_due, self.db_conn)  # don't keep batched writes while waiting for budget
+            self.wait_for_budget(should_stop)
+            if should_stop():
+                return
+
+            requests_before: int = sum(state.requests for state in utils.PROXY_SCHEDULER.states)
+            try:
+                self.process(*work)
+
+            except utils.FAPIDownForMaintenance:
+                # circuit breaker gave up waiting (JUBILANT_MAINTENANCE_MAX_WAIT) or we are shutting down
+                logger.warning(f'FAPI is on maintenance, {work} postponed')
+                self.push(*work)
+
+            self.tokens -= sum(state.requests for state in utils.PROXY_SCHEDULER.states) - requests_before
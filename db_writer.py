@@ -0,0 +1,174 @@
+"""
+Batched writer for collector results
+
+`with db_conn:` commits (and fsyncs) on every exit, so every squad update cost a commit or, with news inserted
+row by row, dozens of them. BatchedWriter.transaction is used instead of `with db_conn:` for squad writes: every
+write is wrapped in a savepoint, so a failed squad is rolled back alone, but commit happens only once per
+WRITE_BATCH_SIZE squads or when the oldest not committed write is older than WRITE_BATCH_LATENCY seconds.
+
+There is no background committer, so latency is checked on every write and by commit_if_due, which idle loops
+should call. Not committed writes are visible for the same connection
+(hooks included) but not for readers with other connections (web), so call flush before long pauses and on exit.
+
+WRITE_BATCH_SIZE = 1 (default) commits every squad as before, but still in one transaction per squad
+
+WriterThread is the only thread which uses collector's connection once main.py has prepared the schema: writes and
+reads alike (utils.store_squad_info, id_index loading, schedulers' selects and other functions decorated by
+utils.on_writer or called by WRITER.call) are queued to it, so the event loop and network threads never wait for
+sqlite and calls never interleave with an open batch. Reads queued to it see not committed writes of the batch, as
+the writes themselves do. connect() opens DB in WAL mode, so readers with own connections (web, discord_outbox.py)
+see committed data only, don't block the writer and aren't blocked by it.
+"""
+import concurrent.futures
+import contextlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+import typing
+
+from EDMCLogging import get_main_logger
+
+logger = get_main_logger()
+
+WRITE_BATCH_SIZE: int = int(os.getenv('JUBILANT_WRITE_BATCH_SIZE', 1))
+WRITE_BATCH_LATENCY: float = float(os.getenv('JUBILANT_WRITE_BATCH_LATENCY', 5))
+
+SQLITE_SYNCHRONOUS: str = os.getenv('JUBILANT_SQLITE_SYNCHRONOUS', 'normal')  # normal is durable enough in WAL mode
+SQLITE_CACHE_SIZE: int = int(os.getenv('JUBILANT_SQLITE_CACHE_SIZE', -64 * 1024))  # negative means KiB
+SQLITE_MMAP_SIZE: int = int(os.getenv('JUBILANT_SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+
+logger.debug(f'WRITE_BATCH_SIZE = {WRITE_BATCH_SIZE}, WRITE_BATCH_LATENCY = {WRITE_BATCH_LATENCY}, '
+             f'SQLITE_SYNCHRONOUS = {SQLITE_SYNCHRONOUS}, SQLITE_CACHE_SIZE = {SQLITE_CACHE_SIZE}, '
+             f'SQLITE_MMAP_SIZE = {SQLITE_MMAP_SIZE}')
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Opens collector's connection: WAL mode and tuned pragmas, usable from WriterThread
+
+    :param path: path to DB file
+    :return:
+    """
+
+    db_conn = sqlite3.connect(path, check_same_thread=False)  # WriterThread serializes access
+    journal_mode: str = db_conn.execute('pragma journal_mode = wal;').fetchone()[0]
+    if journal_mode != 'wal':
+        logger.warning(f'Unable to enable WAL mode, journal_mode is {journal_mode}')
+
+    db_conn.execute(f'pragma synchronous = {SQLITE_SYNCHRONOUS};')
+    db_conn.execute(f'pragma cache_size = {SQLITE_CACHE_SIZE};')
+    db_conn.execute(f'pragma mmap_size = {SQLITE_MMAP_SIZE};')
+
+    return db_conn
+
+
+class WriterThread:
+    def __init__(self, name: str = 'db_writer'):
+        self.name = name
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: typing.Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, function: typing.Callable, *args, **kwargs) -> concurrent.futures.Future:
+        """Queues function call to the writer thread
+
+        :return: future of function's result
+        """
+
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        self._ensure_started()
+        self._queue.put((future, function, args, kwargs))
+        return future
+
+    def call(self, function: typing.Callable, *args, **kwargs) -> typing.Any:
+        """Calls function in the writer thread and waits for the result, calls directly if we are in it already"""
+
+        if threading.current_thread() is self._thread:
+            return function(*args, **kwargs)
+
+        return self.submit(function, *args, **kwargs).result()
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            future, function, args, kwargs = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                future.set_result(function(*args, **kwargs))
+
+            except BaseException as e:
+                future.set_exception(e)
+
+
+class BatchedWriter:
+    def __init__(self, batch_size: int = WRITE_BATCH_SIZE, latency: float = WRITE_BATCH_LATENCY):
+        """
+        :param batch_size: how many transactions to group in one commit
+        :param latency: max age of not committed transaction, seconds
+        """
+
+        self.batch_size = max(batch_size, 1)
+        self.latency = latency
+
+        self.pending: int = 0
+        self.oldest_pending: float = 0.0
+        self.commits: int = 0
+
+    @contextlib.contextmanager
+    def transaction(self, db_conn: sqlite3.Connection) -> typing.Iterator[sqlite3.Connection]:
+        """Drop-in replacement of `with db_conn:` which groups commits
+
+        :param db_conn:
+        :return:
+        """
+
+        if self.batch_size == 1:
+            with db_conn:
+                yield db_conn
+
+            self.commits += 1
+            return
+
+        if not db_conn.in_transaction:
+            db_conn.execute('begin;')
+            self.pending = 0  # somebody has committed our batch, i.e. by `with db_conn:`
+
+        db_conn.execute('savepoint batched_writer;')
+        try:
+            yield db_conn
+
+        except BaseException:
+            db_conn.execute('rollback to batched_writer;')
+            db_conn.execute('release batched_writer;')
+            raise
+
+        db_conn.execute('release batched_writer;')
+
+        if self.pending == 0:
+            self.oldest_pending = time.monotonic()
+
+        self.pending += 1
+        self.commit_if_due(db_conn)
+
+    def commit_if_due(self, db_conn: sqlite3.Connection) -> None:
+        if self.pending >= self.batch_size or \
+                (self.pending != 0 and time.monotonic() - self.oldest_pending >= self.latency):
+            self.flush(db_conn)
+
+    def flush(self, db_conn: sqlite3.Connection) -> None:
+        """Commits pending transactions"""
+
+        if self.pending != 0 or db_conn.in_transaction:
+            logger.debug(f'Committing {self.pending} batched transactions')
+            db_conn.commit()
+            self.commits += 1
+
+        self.pending = 0
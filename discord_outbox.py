@@ -0,0 +1,247 @@
+"""
+Durable outbox for discord notifications
+
+utils.notify_discord doesn't send anything, it only inserts the message to discord_outbox table with the connection
+of the hook, so the message is committed together with squad's data and a slow or failing webhook never holds
+the write transaction. Messages longer than discord's limit are split into several ones.
+Without DISCORD_NOTIFICATIONS_HOOK messages aren't queued at all, so the outbox doesn't grow with undeliverable rows.
+
+DiscordSender is a background thread which delivers the outbox in order: every DISCORD_POLL_INTERVAL seconds it
+takes pending messages, coalesces as many of them as fit in one discord message, sends it and deletes them.
+Rate limits are respected: on 429 it waits for Retry-After and retries, when X-RateLimit-Remaining reaches 0 it
+waits for X-RateLimit-Reset-After. Other failures are retried with exponential backoff up to DISCORD_MAX_BACKOFF,
+messages which failed DISCORD_MAX_ATTEMPTS times are dropped with their content dumped to log.
+
+Sender reads the outbox with its own read only connection, so it sees committed messages only: with
+JUBILANT_WRITE_BATCH_SIZE > 1 a message isn't sent before the batch with its squad data is committed, and isn't
+sent at all if the batch is rolled back. Deletes and attempts updates go through db_writer.WriterThread, as every
+other write of collector's connection, and are committed at once, not in the open batch, so a sent message isn't
+sent again after a crash. Not delivered messages stay in DB and are sent on the next start.
+"""
+import os
+import sqlite3
+import threading
+import time
+import typing
+
+import requests
+
+import db_writer
+import sql_requests
+from EDMCLogging import get_main_logger
+
+logger = get_main_logger()
+
+DISCORD_MESSAGE_LIMIT: int = 2000  # discord's limit of message content length
+DISCORD_POLL_INTERVAL: float = float(os.getenv('JUBILANT_DISCORD_POLL_INTERVAL', 2))  # also coalescing window
+DISCORD_MAX_ATTEMPTS: int = int(os.getenv('JUBILANT_DISCORD_MAX_ATTEMPTS', 8))
+DISCORD_MAX_BACKOFF: float = float(os.getenv('JUBILANT_DISCORD_MAX_BACKOFF', 5 * 60))
+DISCORD_BATCH: int = 20  # messages to take from outbox at once
+DISCORD_NOTIFICATIONS_HOOK: typing.Optional[str] = os.getenv('DISCORD_NOTIFICATIONS_HOOK')
+
+logger.debug(f'DISCORD_POLL_INTERVAL = {DISCORD_POLL_INTERVAL}, DISCORD_MAX_ATTEMPTS = {DISCORD_MAX_ATTEMPTS}, '
+             f'DISCORD_MAX_BACKOFF = {DISCORD_MAX_BACKOFF}')
+
+
+def split_message(message: str, limit: int = DISCORD_MESSAGE_LIMIT) -> list[str]:
+    """Splits message by lines to parts not longer than limit, lines longer than limit are cut
+
+    :param message:
+    :param limit:
+    :return:
+    """
+
+    parts: list[str] = list()
+    current: str = str()
+
+    for line in message.split('\n'):
+        while len(line) > limit:
+            if len(current) != 0:
+                parts.append(current)
+                current = str()
+
+            parts.append(line[:limit])
+            line = line[limit:]
+
+        if len(current) == 0:
+            current = line
+
+        elif len(current) + 1 + len(line) <= limit:
+            current += '\n' + line
+
+        else:
+            parts.append(current)
+            current = line
+
+    if len(current) != 0:
+        parts.append(current)
+
+    return parts
+
+
+def enqueue(message: str, db_conn: sqlite3.Connection) -> None:
+    """Puts message to outbox, should be called in the transaction of the data it's about
+
+    :param message:
+    :param db_conn:
+    :return:
+    """
+
+    if DISCORD_NOTIFICATIONS_HOOK is None:  # nobody would ever send and delete it
+        logger.debug(f'DISCORD_NOTIFICATIONS_HOOK is not set, not queueing message:\n{message}')
+        return
+
+    parts: list[str] = split_message(message)
+    if len(parts) > 1:
+        logger.debug(f'Message of len={len(message)} is split to {len(parts)} parts')
+
+    db_conn.executemany(sql_requests.insert_discord_outbox, [(part,) for part in parts])
+
+
+class DiscordSender:
+    def __init__(self, writer: db_writer.WriterThread, batched_writer: db_writer.BatchedWriter):
+        """
+        :param writer: thread which owns collector's connection
+        :param batched_writer: transactions of collector's connection
+        """
+
+        self.writer = writer
+        self.batched_writer = batched_writer
+        self.hook_url: typing.Optional[str] = DISCORD_NOTIFICATIONS_HOOK
+
+        self.db_conn: typing.Optional[sqlite3.Connection] = None  # collector's one, for writes
+        self.db_path: typing.Optional[str] = None
+        self.backoff: float = 0.0
+        self.sent: int = 0  # discord messages
+        self._wake = threading.Event()
+        self._thread: typing.Optional[threading.Thread] = None
+
+    def start(self, db_conn: sqlite3.Connection) -> None:
+        if self.hook_url is None:
+            logger.warning('DISCORD_NOTIFICATIONS_HOOK is not set, discord notifications are not queued nor sent')
+            return
+
+        self.db_conn = db_conn
+        self.db_path = db_conn.execute('pragma database_list;').fetchone()[2]
+        self._thread = threading.Thread(target=self._run, name='discord_sender', daemon=True)
+        self._thread.start()
+
+    def drain(self, timeout: float) -> bool:
+        """Commits batched writes and waits until outbox is empty, i.e. before reading counters of fake discord
+
+        :param timeout: seconds
+        :return: True if outbox is empty
+        """
+
+        if self._thread is None:
+            return False
+
+        self.writer.call(self.batched_writer.flush, self.db_conn)
+        deadline: float = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if len(self.writer.call(self._fetch, self.db_conn)) == 0:
+                return True
+
+            self._wake.set()
+            time.sleep(0.05)
+
+        return False
+
+    @staticmethod
+    def _fetch(db_conn: sqlite3.Connection) -> list[tuple[int, str, int]]:
+        return db_conn.execute(sql_requests.select_discord_outbox, (DISCORD_BATCH,)).fetchall()
+
+    def _delete(self, message_ids: list[int]) -> None:
+        self.batched_writer.flush(self.db_conn)  # commit the delete alone, not with the open batch
+        with self.db_conn:
+            self.db_conn.executemany(sql_requests.delete_discord_outbox, [(message_id,) for message_id in message_ids])
+
+    def _fail(self, messages: list[tuple[int, str, int]]) -> None:
+        self.batched_writer.flush(self.db_conn)
+        with self.db_conn:
+            for message_id, content, attempts in messages:
+                if attempts + 1 >= DISCORD_MAX_ATTEMPTS:
+                    logger.warning(f'Dropping discord message after {attempts + 1} attempts, content dump:\n{content}')
+                    self.db_conn.execute(sql_requests.delete_discord_outbox, (message_id,))
+
+                else:
+                    self.db_conn.execute(sql_requests.increment_discord_outbox_attempts, (message_id,))
+
+    def _run(self) -> None:
+        reader = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True)  # sees committed messages only
+        while True:
+            self._wake.wait(max(DISCORD_POLL_INTERVAL, self.backoff))
+            self._wake.clear()
+
+            try:
+                self._send_pending(reader)
+
+            except Exception as e:
+                logger.exception('Fail on sending discord outbox', exc_info=e)
+
+    def _send_pending(self, reader: sqlite3.Connection) -> None:
+        while True:
+            pending: list[tuple[int, str, int]] = self._fetch(reader)
+            if len(pending) == 0:
+                return
+
+            # coalesce messages in order while they fit in one
+            batch: list[tuple[int, str, int]] = [pending[0]]
+            content: str = pending[0][1]
+            for message in pending[1:]:
+                if len(content) + 2 + len(message[1]) > DISCORD_MESSAGE_LIMIT:
+                    break
+
+                batch.append(message)
+                content += '\n\n' + message[1]
+
+            if not self._post(content):
+                self.writer.call(self._fail, batch)
+                self.backoff = min(max(self.backoff * 2, DISCORD_POLL_INTERVAL), DISCORD_MAX_BACKOFF)
+                logger.debug(f'Discord sending failed, backoff {self.backoff} s')
+                return
+
+            self.backoff = 0.0
+            self.sent += 1
+            self.writer.call(self._delete, [message[0] for message in batch])
+
+    def _post(self, content: str) -> bool:
+        """Sends one discord message, waits for rate limits
+
+        :param content:
+        :return: True if message is delivered
+        """
+
+        while True:
+            logger.debug('Sending discord message')
+            try:
+                discord_request: requests.Response = requests.post(
+                    url=self.hook_url,
+                    data=f'content={requests.utils.quote(content)}'.encode('utf-8'),
+                    headers={'Content-Type': 'application/x-www-form-urlencoded'},
+                    timeout=30
+                )
+
+            except requests.exceptions.RequestException as e:
+                logger.warning(f'Fail on sending message to discord: {e.__class__.__name__}')
+                return False
+
+            if discord_request.status_code == 429:
+                retry_after: float = float(discord_request.headers.get('Retry-After', 1))
+                logger.info(f'Discord rate limit, retrying after {retry_after} s')
+                time.sleep(retry_after)
+                continue
+
+            if discord_request.headers.get('X-RateLimit-Remaining') == '0':
+                time.sleep(float(discord_request.headers.get('X-RateLimit-Reset-After', 0)))
+
+            try:
+                discord_request.raise_for_status()
+
+            except requests.exceptions.HTTPError as e:
+                logger.exception(f'Fail on sending message to discord ({"/".join(self.hook_url.split("/")[-2:])})'
+                                 f'\n{discord_request.content}', exc_info=e)
+                return False
+
+            logger.debug('Sending successful')
+            return True
@@ -0,0 +1,280 @@
+"""
+Local stand-in for FAPI and capi.demb.design
+
+Serves squadron/info, squadron/news/list and random_token endpoints (plus a sink for discord webhook) for a
+synthetic population of squads, so collector can be run and measured without touching production services.
+
+Population is ids [first_id, first_id + population), `holes` share of them answers 404 as deleted squads do,
+ids after the population don't exist yet. Every info request changes squad's state with `change_rate` probability.
+During maintenance windows every FAPI endpoint answers 418. Every answer is delayed by `latency` seconds.
+
+Usage:
+    python fake_fapi.py [--port 8418] [--population 1000] [--holes 0.1] [--latency 0.05] [--maintenance 60:30]
+
+then run jubilant with
+    JUBILANT_FAPI_BASE_URL=http://127.0.0.1:8418/squadron/
+    JUBILANT_TOKEN_URL=http://127.0.0.1:8418/random_token
+    DISCORD_NOTIFICATIONS_HOOK=http://127.0.0.1:8418/discord
+    DEMB_CAPI_AUTH=<anything>
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from EDMCLogging import get_main_logger
+
+logger = get_main_logger()
+
+_SCORE_KINDS: tuple = ('trade', 'combat', 'exploration', 'cqc', 'bgs', 'powerplay', 'aegis')
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'available.json'), 'r', encoding='utf-8') as file:
+    _TAG_IDS: tuple = tuple(
+        tag['ServerUniqueId'] for collection in json.load(file)['SquadronTagData']['SquadronTagCollections']
+        for tag in collection['SquadronTags']
+    )
+
+
+class FakeFAPI:
+    def __init__(
+            self,
+            population: int = 1000,
+            first_id: int = 1,
+            holes: float = 0.1,
+            latency: float = 0.05,
+            change_rate: float = 0.1,
+            maintenance: list[tuple[float, float]] = None,
+            seed: int = 0):
+        """
+        :param population: amount of allocated ids
+        :param first_id: the first allocated id
+        :param holes: share of allocated ids which are deleted squads
+        :param latency: seconds to delay every answer
+        :param change_rate: probability of squad's state change on every info request
+        :param maintenance: list of (start, duration) in seconds since start() when FAPI answers 418
+        :param seed: seed for population and changes
+        """
+
+        self.first_id = first_id
+        self.last_id = first_id + population - 1
+        self.latency = latency
+        self.change_rate = change_rate
+        self.maintenance: list[tuple[float, float]] = maintenance or list()
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.deleted: set[int] = set(self._random.sample(range(first_id, self.last_id + 1), int(population * holes)))
+        self._squads: dict[int, dict] = dict()
+
+        self.started: float = time.monotonic()
+        self.counters: dict[str, int] = {'info': 0, 'news': 0, 'token': 0, 'discord': 0, 'maintenance': 0}
+        self._server: ThreadingHTTPServer = None
+
+    def exists(self, squad_id: int) -> bool:
+        return self.first_id <= squad_id <= self.last_id and squad_id not in self.deleted
+
+    def on_maintenance(self) -> bool:
+        now: float = time.monotonic() - self.started
+        return any(start <= now < start + duration for start, duration in self.maintenance)
+
+    def squad_info(self, squad_id: int) -> dict:
+        with self._lock:
+            if squad_id not in self._squads:
+                squad_random = random.Random(squad_id)
+                self._squads[squad_id] = {
+                    'id': squad_id,
+                    'name': f'FAKE SQUADRON {squad_id}',
+                    'tag': f'F{squad_id % 1000:03d}',
+                    'ownerName': f'CMDR {squad_id}'.encode('utf-8').hex(),
+                    'ownerId': 100000 + squad_id,
+                    'platform': squad_random.choice(('PC', 'PS4', 'XBOX')),
+                    'created': '2021-01-01 00:00:00',
+                    'created_ts': 1609459200,
+                    'acceptingNewMembers': True,
+                    'powerId': None,
+                    'powerName': None,
+                    'superpowerId': 1,
+                    'superpowerName': 'Federation',
+                    'factionId': 1,
+                    'factionName': 'Fake Faction',
+                    'userTags': sorted(squad_random.sample(_TAG_IDS, 3)),
+                    'memberCount': squad_random.randint(1, 500),
+                    'pendingCount': 0,
+                    'full': False,
+                    'publicComms': False,
+                    'publicCommsOverride': False,
+                    'publicCommsAvailable': True,
+                    **{
+                        f'{season}_season_{kind}_score': squad_random.randint(0, 10000)
+                        for season in ('current', 'previous') for kind in _SCORE_KINDS
+                    },
+                    'motd': f'Welcome to squadron {squad_id}'
+                }
+
+            squad: dict = self._squads[squad_id]
+            if self._random.random() < self.change_rate:
+                squad['memberCount'] = max(1, squad['memberCount'] + self._random.choice((-1, 1)))
+                squad['current_season_combat_score'] += self._random.randint(1, 100)
+
+            return {key: value for key, value in squad.items() if key != 'motd'}
+
+    def squad_news(self, squad_id: int) -> dict:
+        with self._lock:
+            motd: str = self._squads.get(squad_id, dict()).get('motd', '')
+
+        return {
+            'id': squad_id,
+            'public_statements': [{
+                'id': squad_id,
+                'date': 1609459200,
+                'category': 'Squadrons_History_Category_PublicStatement',
+                'motd': motd,
+                'author': f'CMDR {squad_id}',
+                'cmdr_id': 100000 + squad_id,
+                'user_id': 200000 + squad_id
+            }],
+            'internal_statements': [],
+            'recent_activities': []
+        }
+
+    def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Starts serving in a daemon thread
+
+        :param host:
+        :param port: 0 for any free port
+        :return: base url of the server
+        """
+
+        self.started = time.monotonic()
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='fake_fapi', daemon=True).start()
+
+        base_url: str = f'http://{host}:{self._server.server_address[1]}/'
+        logger.info(f'Fake FAPI is serving on {base_url}')
+        return base_url
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _make_handler(fake: FakeFAPI) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format_str, *args):  # noqa, don't spam stderr
+            pass
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            time.sleep(fake.latency)
+
+            if url.path.endswith('/random_token'):
+                fake.counters['token'] += 1
+                self.answer(200, {'access_token': f'fake-{fake.counters["token"]}'})
+                return
+
+            if not url.path.startswith('/squadron/'):
+                self.answer(404, {})
+                return
+
+            if fake.on_maintenance():
+                fake.counters['maintenance'] += 1
+                self.answer(418, {'status': 418, 'message': 'I\'m a teapot'})
+                return
+
+            if not self.headers.get('Authorization', '').startswith('Bearer '):
+                self.answer(401, {})
+                return
+
+            try:
+                squad_id: int = int(parse_qs(url.query)['squadronId'][0])
+
+            except (KeyError, ValueError):
+                self.answer(400, {})
+                return
+
+            if url.path.endswith('/info'):
+                fake.counters['info'] += 1
+                if fake.exists(squad_id):
+                    self.answer(200, {'squadron': fake.squad_info(squad_id)})
+
+                else:
+                    self.answer(404, {})
+
+            elif url.path.endswith('/news/list'):
+                fake.counters['news'] += 1
+                # FAPI answers 200 with empty list for not existing squads
+                self.answer(200, {'squadron': fake.squad_news(squad_id) if fake.exists(squad_id) else []})
+
+            else:
+                self.answer(404, {})
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if urlparse(self.path).path == '/discord':
+                fake.counters['discord'] += 1
+                self.answer(204, None)
+
+            else:
+                self.answer(404, {})
+
+        def answer(self, code: int, body) -> None:
+            content: bytes = b'' if body is None else json.dumps(body).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+    return Handler
+
+
+def parse_maintenance(windows: list[str]) -> list[tuple[float, float]]:
+    """Parses ['start:duration', ...]"""
+    return [tuple(float(part) for part in window.split(':', 1)) for window in windows]
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--population', type=int, default=1000, help='amount of allocated ids')
+    parser.add_argument('--first-id', type=int, default=1, help='the first allocated id')
+    parser.add_argument('--holes', type=float, default=0.1, help='share of deleted squads among allocated ids')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds to delay every answer')
+    parser.add_argument('--change-rate', type=float, default=0.1, help='probability of state change per request')
+    parser.add_argument('--maintenance', action='append', default=list(), metavar='START:DURATION',
+                        help='seconds since start when FAPI answers 418, can be repeated')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def from_arguments(args: argparse.Namespace) -> FakeFAPI:
+    return FakeFAPI(
+        population=args.population,
+        first_id=args.first_id,
+        holes=args.holes,
+        latency=args.latency,
+        change_rate=args.change_rate,
+        maintenance=parse_maintenance(args.maintenance),
+        seed=args.seed
+    )
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Local fake FAPI server')
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=8418)
+    add_arguments(arg_parser)
+
+    arguments = arg_parser.parse_args()
+    fake_fapi = from_arguments(arguments)
+    fake_fapi.start(arguments.host, arguments.port)
+
+    try:
+        while True:
+            time.sleep(60)
+            logger.info(f'Fake FAPI counters: {fake_fapi.counters}')
+
+    except KeyboardInterrupt:
+        fake_fapi.stop()
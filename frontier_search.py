@@ -0,0 +1,146 @@
+"""
+Frontier search for discover mode
+
+Instead of walking ids one by one from the last known id, probe exponentially growing strides past it
+(last + 1, last + 2, last + 4, ...) until probe misses, it brackets the current maximum allocated id.
+Then bisect the bracket to find the maximum and finally update all not probed ids between the last known id and
+the found maximum, in parallel if async collector enabled. It takes O(log n) probes to find n new squads
+instead of n probes plus TRIES_LIMIT_ON_THE_TIME wasted ones.
+
+Single miss can be just a deleted squad, so miss counts only if FRONTIER_MISS_CONFIRMATIONS next ids miss too.
+
+Enables by JUBILANT_DISCOVER_STRATEGY=frontier env, default is linear
+"""
+import os
+import sqlite3
+import typing
+from typing import Union
+
+import collector
+import utils
+from EDMCLogging import get_main_logger
+
+logger = get_main_logger()
+
+DISCOVER_STRATEGY: str = os.getenv('JUBILANT_DISCOVER_STRATEGY', 'linear').lower()
+FRONTIER_MISS_CONFIRMATIONS: int = int(os.getenv('JUBILANT_FRONTIER_MISS_CONFIRMATIONS', 2))
+
+logger.debug(f'DISCOVER_STRATEGY = {DISCOVER_STRATEGY}, FRONTIER_MISS_CONFIRMATIONS = {FRONTIER_MISS_CONFIRMATIONS}')
+
+
+class FrontierSearch:
+    def __init__(self, db_conn: sqlite3.Connection, should_stop: typing.Callable[[], bool] = lambda: False):
+        self.db_conn = db_conn
+        self.should_stop = should_stop
+        self.probed: dict[int, bool] = dict()  # squad_id: exists
+
+    def probe(self, squad_id: int) -> bool:
+        """Updates squad with suppressing absence, remembers result
+
+        :param squad_id:
+        :return: if squad exists
+        """
+
+        if squad_id not in self.probed:
+            squad_info = utils.update_squad_info(squad_id, self.db_conn, suppress_absence=True)
+            self.probed[squad_id] = isinstance(squad_info, dict)
+
+        return self.probed[squad_id]
+
+    def probe_area(self, squad_id: int) -> Union[int, None]:
+        """Probes squad_id and FRONTIER_MISS_CONFIRMATIONS ids after it
+
+        :param squad_id:
+        :return: first existing id of area or None if whole area misses
+        """
+
+        for id_to_try in range(squad_id, squad_id + FRONTIER_MISS_CONFIRMATIONS + 1):
+            if self.should_stop():
+                return None
+
+            if self.probe(id_to_try):
+                return id_to_try
+
+        return None
+
+    def find_max_id(self, base_id: int) -> int:
+        """Finds maximum allocated id, assuming base_id is allocated
+
+        :param base_id: the last known id
+        :return: the greatest existing id found
+        """
+
+        # galloping: bracket the maximum between known existing lo and missing hi
+        lo: int = base_id
+        stride: int = 1
+        while True:
+            found: Union[int, None] = self.probe_area(lo + stride)
+            if found is None:
+                hi: int = lo + stride
+                break
+
+            lo = found
+            stride *= 2
+
+        logger.debug(f'Maximum id is bracketed in ({lo}, {hi})')
+
+        # bisecting
+        while hi - lo > 1 and not self.should_stop():
+            mid: int = (lo + hi) // 2
+            found: Union[int, None] = self.probe_area(mid)
+            if found is not None and found < hi:
+                lo = found
+
+            else:
+                hi = mid
+
+        logger.debug(f'Maximum id found: {lo}, probes spent: {len(self.probed)}')
+        return lo
+
+    def fill(self, base_id: int, max_id: int) -> None:
+        """Updates ids in (base_id, max_id] which weren't probed yet, marks missing ones as deleted since
+        there is an existing squad after them
+
+        :param base_id:
+        :param max_id:
+        :return:
+        """
+
+        ids_to_fill: list[int] = [
+            squad_id for squad_id in range(base_id + 1, max_id + 1) if squad_id not in self.probed
+        ]
+        logger.debug(f'Filling {len(ids_to_fill)} ids between {base_id} and {max_id}')
+
+        if collector.ASYNC_COLLECTOR:
+            filled: dict = collector.collect(ids_to_fill, self.db_conn, suppress_absence=True,
+                                             should_stop=self.should_stop)
+
+            for squad_id, squad_info in filled.items():
+                self.probed[squad_id] = isinstance(squad_info, dict)
+
+        else:
+            for squad_id in ids_to_fill:
+                if self.should_stop():
+                    return
+
+                self.probe(squad_id)
+
+        if self.should_stop():
+            return
+
+        for squad_id in range(base_id + 1, max_id + 1):
+            if self.probed.get(squad_id) is False:
+                utils.properly_delete_squadron(squad_id, self.db_conn)
+
+    def run(self, base_id: int) -> int:
+        """Discovers squads after base_id
+
+        :param base_id: the last known id
+        :return: the greatest existing id found
+        """
+
+        max_id: int = self.find_max_id(base_id)
+        if not self.should_stop():
+            self.fill(base_id, max_id)
+
+        return max_id
@@ -46,23 +46,55 @@ def notify_properly_delete(squad_id: int, db_conn: sqlite3.Connection) -> None:
         hook(squad_id, db_conn)
 
 
-def notify_insert_data(squad_info: dict, db_conn: sqlite3.Connection) -> None:
+class StateChange(typing.NamedTuple):
+    """Squad's state before and after the refresh, loaded by utils.store_squad_info before writing, so insert data
+    hooks don't have to read DB"""
+
+    old: typing.Optional[dict]  # squads_states columns and motd, None if squad is new for us
+    new: dict  # the same for the refresh, equal to old if nothing changed
+    changed: dict[str, tuple[typing.Any, typing.Any]]  # column: (old, new) of changed columns, all if squad is new
+
+
+def make_state_change(
+        previous_state: typing.Optional[tuple],
+        previous_motd: typing.Optional[str],
+        new_state: tuple,
+        motd: typing.Optional[str]) -> StateChange:
+    """
+    :param previous_state: squads_states row in sql_requests.SQUAD_STATE_COLUMNS order, None if squad is new for us
+    :param previous_motd:
+    :param new_state: the same for the refresh
+    :param motd:
+    :return:
+    """
+
+    new: dict = dict(zip(sql_requests.SQUAD_STATE_COLUMNS, new_state), motd=motd)
+    if previous_state is None:
+        return StateChange(None, new, {column: (None, value) for column, value in new.items()})
+
+    old: dict = dict(zip(sql_requests.SQUAD_STATE_COLUMNS, previous_state), motd=previous_motd)
+    return StateChange(old, new, {column: (old[column], new[column]) for column in new if old[column] != new[column]})
+
+
+def notify_insert_data(squad_info: dict, state_change: StateChange, db_conn: sqlite3.Connection) -> None:
     """Notifies all insert data hooks, calls after inserting
 
     :param squad_info:
+    :param state_change:
     :param db_conn:
     :return:
     """
 
     # logger.debug(f'Notifying insert data hooks for {squad_info["id"]} ID')
     for hook in insert_data_hooks:
-        hook(squad_info, db_conn)
+        hook(squad_info, state_change, db_conn)
 
 
-def detect_new_ru_squads(squad_info: dict, db_conn: sqlite3.Connection) -> None:
+def detect_new_ru_squads(squad_info: dict, state_change: StateChange, db_conn: sqlite3.Connection) -> None:
     """Sends alert if it was firstly discovered ru squad with >5 members
 
     :param squad_info:
+    :param state_change:
     :param db_conn:
     :return:
     """
@@ -75,8 +107,8 @@ def detect_new_ru_squads(squad_info: dict, db_conn: sqlite3.Connection) -> None:
     """
     MEMBERS_LOW_THRESHOLD: int = 1
 
-    if db_conn.execute(sql_requests.check_if_squad_exists_in_db, (squad_info['id'],)).fetchone()[0] == 1:
-        # squad has only one record, it means squad just discovered
+    if state_change.old is None:
+        # squad had no records before this one, it means squad just discovered
 
         if 32 in squad_info['userTags']:
             # it's russian squad
@@ -115,13 +147,15 @@ activity:
     current season sum: {current_season_sum}
 motd: {motd}"""
 
-                utils.notify_discord(message)
+                utils.notify_discord(message, db_conn)
 
 
-def detect_important_changes_ru_squads(squad_info: dict, db_conn: sqlite3.Connection) -> None:
+def detect_important_changes_ru_squads(squad_info: dict, state_change: StateChange,
+                                       db_conn: sqlite3.Connection) -> None:
     """Alert if something important changed for a russian squad
 
     :param squad_info: FDEV authored dict
+    :param state_change:
     :param db_conn:
     :return:
     """
@@ -139,13 +173,16 @@ def detect_important_changes_ru_squads(squad_info: dict, db_conn: sqlite3.Connec
     """
 
     squad_id = squad_info['id']
-    if db_conn.execute(sql_requests.check_if_squad_exists_in_db, (squad_id,)).fetchone()[0] == 1:
+    if state_change.old is None:
         # we just discover squad, not updating
         return
 
-    new_tags_raw, old_tags_raw = new_old_diff('user_tags', db_conn, squad_id)
-    new_tags: list = json.loads(new_tags_raw)
-    old_tags: list = json.loads(old_tags_raw)
+    if len(state_change.changed) == 0:
+        # nothing to report
+        return
+
+    new_tags: list = squad_info['userTags']
+    old_tags: list = json.loads(state_change.old['user_tags'] or '[]')  # no tags if squad was deleted
 
     message: str = str()
     message_start = str()
@@ -181,7 +218,7 @@ def detect_important_changes_ru_squads(squad_info: dict, db_conn: sqlite3.Connec
         message = message + 'Squadron stop being russian\n'
 
     # let's clarify situation with members count
-    new_members, old_members = new_old_diff('member_count', db_conn, squad_id)
+    new_members, old_members = state_change.new['member_count'], state_change.old['member_count']
 
     if new_members == old_members:
         # count wasn't changed
@@ -190,8 +227,8 @@ def detect_important_changes_ru_squads(squad_info: dict, db_conn: sqlite3.Connec
     else:
         message = message + f'Members count changed {old_members} -> {new_members}\n'
 
-    # let's check motd
-    new_motd, old_motd = new_old_news_diff('motd', db_conn, squad_id)  # TODO: make easier and better
+    # let's check motd, if news were skipped by smart news, new motd is the previous one
+    new_motd, old_motd = state_change.new['motd'], state_change.old['motd']
 
     if new_motd == old_motd:
         # motd wasn't changed
@@ -201,7 +238,7 @@ def detect_important_changes_ru_squads(squad_info: dict, db_conn: sqlite3.Connec
         message = message + f'Motd changed, old:\n```\n{old_motd}\n```\nnew:\n```\n{new_motd}\n```\n'
 
     # let's check ownership
-    new_owner, old_owner = new_old_diff('owner_name', db_conn, squad_id)
+    new_owner, old_owner = state_change.new['owner_name'], state_change.old['owner_name']
 
     if new_owner == old_owner:
         # the same owner
@@ -211,7 +248,7 @@ def detect_important_changes_ru_squads(squad_info: dict, db_conn: sqlite3.Connec
         message = message + f'Ownership changed: {old_owner} -> {new_owner}\n'
 
     # let's check minor faction
-    new_faction, old_faction = new_old_diff('faction_name', db_conn, squad_id)
+    new_faction, old_faction = state_change.new['faction_name'], state_change.old['faction_name']
 
     if new_faction == old_faction:
         # the same faction
@@ -232,7 +269,8 @@ def detect_important_changes_ru_squads(squad_info: dict, db_conn: sqlite3.Connec
         message = message_start + message
         utils.notify_discord(f'State changing for RU squad `{squad_info["name"]}` {squad_info["tag"]}\n'
                              f'platform: {squad_info["platform"]}\nmembers: {squad_info["memberCount"]}\n'
-                             f'created: {squad_info["created"]}\nowner: {squad_info["ownerName"]}\n' + message)
+                             f'created: {squad_info["created"]}\nowner: {squad_info["ownerName"]}\n' + message,
+                             db_conn)
 
     return
 
@@ -249,70 +287,26 @@ def detect_removing_ru_squads(squad_id: int, db_conn: sqlite3.Connection):
     Detect if removing squad was russian
     send alert 
     """
-    important = db_conn.execute(sql_requests.select_important_before_delete, (squad_id,)).fetchone()
+    if db_conn.execute(sql_requests.check_squad_has_user_tag, (32, squad_id)).fetchone()[0] == 0:
+        return  # not ru squad or squad doesn't exists in our DB
 
-    if important is None:
-        return  # squad doesn't exists in our DB so we can't figure out anything about it
+    important = db_conn.execute(sql_requests.select_important_before_delete, (squad_id,)).fetchone()
 
     name = important[0]
     platform = important[1]
     members = important[2]
     tag = important[3]
-    user_tags = json.loads(important[4])
     created = important[5]
     owner_name = important[6]
 
-    if 32 in user_tags:
-        # ru squad
-        message = f'Deleted RU squad `{name}`\nplatform: {platform}, members: {members}, tag: {tag}, ' \
-                  f'created: {created}, owner: `{owner_name}`'
-        utils.notify_discord(message)
+    # ru squad
+    message = f'Deleted RU squad `{name}`\nplatform: {platform}, members: {members}, tag: {tag}, ' \
+              f'created: {created}, owner: `{owner_name}`'
+    utils.notify_discord(message, db_conn)
 
     return
 
 
-# should I move it to utils?
-def new_old_diff(column: str, db_conn: sqlite3.Connection, squad_id: int) -> typing.Tuple[typing.Any, typing.Any]:
-    """Returns last two record for squad_id for specified column
-
-    :param column:
-    :param db_conn:
-    :param squad_id:
-    :return:
-    """
-    sql_req: sqlite3.Cursor = db_conn.execute(sql_requests.select_old_new.format(column=column), (squad_id,))
-
-    new = sql_req.fetchone()[0]
-    old = sql_req.fetchone()[0]
-
-    return new, old
-
-
-def new_old_news_diff(column: str, db_conn: sqlite3.Connection, squad_id: int) -> typing.Tuple[typing.Any, typing.Any]:
-    """Returns last two record for squad_id for specified column
-
-    :param column:
-    :param db_conn:
-    :param squad_id:
-    :return:
-    """
-    sql_req: sqlite3.Cursor = db_conn.execute(sql_requests.select_new_old_news.format(column=column), (squad_id,))
-
-    try:
-        new = sql_req.fetchone()[0]
-
-    except TypeError:
-        new = None
-
-    try:
-        old = sql_req.fetchone()[0]
-
-    except TypeError:
-        old = None
-
-    return new, old
-
-
 def tags_diff2str(new_tags_ids: list, old_tags_ids: list) -> str:
     """Compares two list of tags, new and old, and returns it in diff like str
 
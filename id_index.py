@@ -0,0 +1,158 @@
+"""
+In-memory index of squad ids we know about
+
+"known" ranges (squad has any record in squads_states) and "deleted" bitmap (squad is properly deleted in our DB).
+"Never seen" is just absence in "known". Index is loaded from DB once per connection, on the first use, and kept in
+sync by utils.store_squad_info and utils.properly_delete_squadron, so collector checks don't touch sqlite at all.
+
+Known ids are loaded from known_id_ranges table, which squads_states_to_known_id_ranges trigger keeps up to date
+on every squads_states insert, so loading takes one row per gap between known ids, not a scan of the whole history.
+The first hole for discover and the last known id are the end of the first and of the last range.
+
+Usage:
+    index = id_index.get(db_conn)
+    index.is_deleted(squad_id)
+"""
+import bisect
+import sqlite3
+from typing import Iterator, Union
+
+import sql_requests
+from EDMCLogging import get_main_logger
+
+logger = get_main_logger()
+
+
+class Bitmap:
+    def __init__(self):
+        self._bits = bytearray()
+        self.count: int = 0
+
+    def add(self, number: int) -> None:
+        byte_index, bit = divmod(number, 8)
+        if byte_index >= len(self._bits):
+            # grow with a reserve to not realloc on every discovered squad
+            self._bits.extend(bytes(byte_index - len(self._bits) + 1 + 1024))
+
+        if not self._bits[byte_index] & (1 << bit):
+            self._bits[byte_index] |= 1 << bit
+            self.count += 1
+
+    def __contains__(self, number: int) -> bool:
+        byte_index, bit = divmod(number, 8)
+        return byte_index < len(self._bits) and bool(self._bits[byte_index] & (1 << bit))
+
+
+class IdRanges:
+    """Sorted disjoint ranges [start, end] of ids, in-memory mirror of known_id_ranges table"""
+
+    def __init__(self):
+        self.starts: list[int] = list()
+        self.ends: list[int] = list()
+        self.count: int = 0  # ids in all ranges
+
+    def append(self, start: int, end: int) -> None:
+        """Adds range after all existing ones, for loading from DB in range_start order"""
+        self.starts.append(start)
+        self.ends.append(end)
+        self.count += end - start + 1
+
+    def _range_before(self, number: int) -> int:
+        """Index of the last range which starts at number or before, -1 if there is no such range"""
+        return bisect.bisect_right(self.starts, number) - 1
+
+    def __contains__(self, number: int) -> bool:
+        index: int = self._range_before(number)
+        return index >= 0 and self.ends[index] >= number
+
+    def add(self, number: int) -> None:
+        """The same as squads_states_to_known_id_ranges trigger does"""
+        index: int = self._range_before(number)
+        if index >= 0 and self.ends[index] >= number:
+            return
+
+        touches_previous: bool = index >= 0 and self.ends[index] == number - 1
+        touches_next: bool = index + 1 < len(self.starts) and self.starts[index + 1] == number + 1
+
+        if touches_previous and touches_next:
+            self.ends[index] = self.ends.pop(index + 1)
+            del self.starts[index + 1]
+
+        elif touches_previous:
+            self.ends[index] = number
+
+        elif touches_next:
+            self.starts[index + 1] = number
+
+        else:
+            self.starts.insert(index + 1, number)
+            self.ends.insert(index + 1, number)
+
+        self.count += 1
+
+    def first_gap(self) -> Union[int, None]:
+        """The first id after the first range, None if there are no ranges"""
+        return self.ends[0] + 1 if len(self.ends) != 0 else None
+
+    def last(self) -> Union[int, None]:
+        return self.ends[-1] if len(self.ends) != 0 else None
+
+    def gaps(self) -> Iterator[tuple[int, int]]:
+        """Yields (first, last) ids of every gap between ranges"""
+        for index in range(len(self.starts) - 1):
+            yield self.ends[index] + 1, self.starts[index + 1] - 1
+
+
+class IdIndex:
+    def __init__(self, db_conn: sqlite3.Connection):
+        self.known = IdRanges()
+        self.deleted = Bitmap()
+
+        for range_start, range_end in db_conn.execute(sql_requests.select_known_id_ranges):
+            self.known.append(range_start, range_end)
+
+        for row in db_conn.execute(sql_requests.select_all_deleted_ids):
+            self.deleted.add(row[0])
+
+        logger.info(f'Id index loaded: {self.known.count} known in {len(self.known.starts)} ranges, '
+                    f'{self.deleted.count} deleted')
+
+    def is_known(self, squad_id: int) -> bool:
+        return squad_id in self.known
+
+    def is_deleted(self, squad_id: int) -> bool:
+        return squad_id in self.deleted
+
+    def mark_known(self, squad_id: int) -> None:
+        self.known.add(squad_id)
+
+    def mark_deleted(self, squad_id: int) -> None:
+        self.known.add(squad_id)
+        self.deleted.add(squad_id)
+
+    def first_hole(self) -> Union[int, None]:
+        """The first unknown id after the smallest known one
+
+        :return: id or None if we don't know any squad
+        """
+
+        return self.known.first_gap()
+
+    def last_known(self) -> Union[int, None]:
+        return self.known.last()
+
+
+_indexes: dict[int, tuple[sqlite3.Connection, IdIndex]] = dict()
+
+
+def get(db_conn: sqlite3.Connection) -> IdIndex:
+    """Returns index for the connection, loads it on the first call
+
+    :param db_conn:
+    :return:
+    """
+
+    if id(db_conn) not in _indexes:
+        _indexes[id(db_conn)] = (db_conn, IdIndex(db_conn))  # keep connection alive, so id() isn't reused
+
+    return _indexes[id(db_conn)][1]
@@ -1,17 +1,34 @@
+import atexit
+import json
+import os
 import signal
-import sqlite3
 import sys
 import time
+from typing import Union
 
+import archive
+import collector
+import daemon_scheduler
+import db_writer
+import frontier_search
 import sql_requests
 import utils
 from EDMCLogging import get_main_logger
 
 logger = get_main_logger()
-db = sqlite3.connect('squads.sqlite')
+db = db_writer.connect(os.getenv('SQLITE_DB', 'squads.sqlite'))
 
+utils.detach_legacy_squads_states(db)
 with open('sql_schema.sql', 'r', encoding='utf-8') as schema_file:
-    db.executescript(''.join(schema_file.readlines()))
+    schema: str = ''.join(schema_file.readlines())
+
+db.executescript(schema)
+if utils.encode_legacy_squads_states(db):
+    db.executescript(schema)  # backfills of the schema read squads_states, run them on the moved rows
+
+utils.prepare_news_storage(db)
+utils.DISCORD_SENDER.start(db)  # delivers discord_outbox, see discord_outbox.py
+atexit.register(utils.WRITER.call, utils.DB_WRITER.flush, db)  # commit batched writes, see db_writer.py
 
 shutting_down: bool = False
 can_be_shutdown: bool = False
@@ -79,6 +96,7 @@ def shutdown_callback(sig: int, frame) -> None:
 
     global shutting_down
     shutting_down = True
+    utils.CIRCUIT_BREAKER.abort()  # don't wait for the end of maintenance
 
     if can_be_shutdown:
         logger.info('Can be shutdown')
@@ -93,9 +111,17 @@ def discover(back_count: int = 0):
 
     # id_to_try = utils.get_last_known_id(db)
     # id_to_try = utils.get_next_id_for_discover(db) - 1
-    id_to_try = utils.get_next_hole_id_for_discover(db) - 1
-    tries: int = 0
-    failed: list = list()
+    checkpoint = utils.load_discover_checkpoint(db)
+    if checkpoint is not None:
+        id_to_try, tries, failed = checkpoint  # type: int, int, list
+        logger.info(f'Resuming discover from checkpoint: last processed id {id_to_try}, tries {tries}, '
+                    f'{len(failed)} failed ids pending')
+
+    else:
+        id_to_try = utils.get_next_hole_id_for_discover(db) - 1
+        tries: int = 0
+        failed: list = list()
+
     TRIES_LIMIT_RETROSPECTIVELY: int = 5000
     TRIES_LIMIT_ON_THE_TIME: int = 5
 
@@ -117,40 +143,89 @@ def discover(back_count: int = 0):
     if back_count != 0:
         logger.debug(f'back_count = {back_count}')
 
-        squad_id: list
-        for squad_id in db.execute(sql_requests.select_new_squads_to_update, (back_count,)).fetchall():
-            squad_id: int = squad_id[0]
-            logger.debug(f'Back updating {squad_id}')
-            utils.update_squad_info(squad_id, db)
-
-    while True:
+        back_ids: list[int] = [
+            squad_id[0] for squad_id in utils.fetch_all(db, sql_requests.select_new_squads_to_update, (back_count,))
+        ]
 
-        if shutting_down:
-            return
+        if collector.ASYNC_COLLECTOR:
+            logger.debug(f'Back updating {back_ids}')
+            collector.collect(back_ids, db, should_stop=lambda: shutting_down)
 
-        id_to_try = id_to_try + 1
-        # logger.debug(f'Starting discover loop iteration, tries: {tries} of {tries_limit}, id to try {id_to_try}, '
-        #             f'failed list: {failed}')
+        else:
+            for squad_id in back_ids:
+                logger.debug(f'Back updating {squad_id}')
+                utils.update_squad_info(squad_id, db)
+
+    if frontier_search.DISCOVER_STRATEGY == 'frontier':
+        if checkpoint is not None:
+            # frontier search doesn't resume from it, and a later linear run must not resume from a stale position
+            logger.warning(f'Discover checkpoint (last processed id {id_to_try}) is ignored by frontier strategy, '
+                           f'clearing it')
+            utils.clear_discover_checkpoint(db)
+
+        last_known_id: int = utils.get_last_known_id(db)
+        max_id = frontier_search.FrontierSearch(db, should_stop=lambda: shutting_down).run(last_known_id)
+        logger.info(f'Frontier discover done, {max_id - last_known_id} ids after {last_known_id} processed')
+        return
 
-        if tries == smart_tries_limit(id_to_try):
-            break
+    last_checkpoint: float = time.time()
+    finished: bool = False  # tries limit reached, so we don't need a checkpoint anymore
 
-        squad_info = utils.update_squad_info(id_to_try, db, suppress_absence=True)
+    def process_discovered(squad_id: int, squad_info) -> None:
+        nonlocal id_to_try, tries, failed, last_checkpoint
 
         if isinstance(squad_info, dict):  # success
-            logger.debug(f'Success discover for {id_to_try} ID')
+            logger.debug(f'Success discover for {squad_id} ID')
             tries = 0  # reset tries counter
 
-            for failed_squad in failed:  # since we found an exists squad, then all previous failed wasn't exists
+            for failed_squad in failed:  # since we found an exists squad, previous failed don't exist
                 utils.properly_delete_squadron(failed_squad, db)
 
             failed = list()
 
         else:  # fail, should be only False
-            logger.debug(f'Fail on discovery for {id_to_try} ID')
-            failed.append(id_to_try)
+            logger.debug(f'Fail on discovery for {squad_id} ID')
+            failed.append(squad_id)
             tries = tries + 1
 
+        id_to_try = squad_id  # the last processed id
+
+        if time.time() - last_checkpoint >= utils.DISCOVER_CHECKPOINT_INTERVAL:
+            utils.save_discover_checkpoint(db, id_to_try, tries, failed)
+            last_checkpoint = time.time()
+
+    def next_id_to_try(in_flight: int) -> Union[int, None]:
+        # ids in flight follow the last processed one, don't probe further than a serial scan would if they all fail
+        squad_id: int = id_to_try + in_flight + 1
+        if shutting_down or tries + in_flight >= smart_tries_limit(squad_id):
+            return None
+
+        return squad_id
+
+    try:
+        if collector.ASYNC_COLLECTOR:
+            # one collector for the whole scan, results come in ids order
+            collector.collect_stream(
+                next_id_to_try, process_discovered, db, suppress_absence=True, should_stop=lambda: shutting_down)
+
+        else:
+            while True:
+                squad_id: Union[int, None] = next_id_to_try(0)
+                if squad_id is None:
+                    break
+
+                process_discovered(squad_id, utils.update_squad_info(squad_id, db, suppress_absence=True))
+
+        finished = tries >= smart_tries_limit(id_to_try + 1)
+
+    finally:
+        # shutdown, maintenance or crash, save progress to resume from it
+        if finished:
+            utils.clear_discover_checkpoint(db)
+
+        else:
+            utils.save_discover_checkpoint(db, id_to_try, tries, failed)
+
 
 def update(squad_id: int = None, amount_to_update: int = 1, thursday_target: bool = False):
     """
@@ -172,14 +247,23 @@ def update(squad_id: int = None, amount_to_update: int = 1, thursday_target: boo
 
     if thursday_target:
         prev_thursday = utils.get_previous_thursday_severs_reboot_datetime()
-        squads_id_to_update: list = db.execute(
-            sql_requests.select_squads_to_update_thursday_aimed, (prev_thursday, amount_to_update)).fetchall()
+        squads_id_to_update: list = utils.fetch_all(
+            db, sql_requests.select_squads_to_update_thursday_aimed, (prev_thursday, amount_to_update))
 
         if len(squads_id_to_update) == 0:
             logger.info(f'thursday_target and no squads to update')
 
     else:
-        squads_id_to_update: list = db.execute(sql_requests.select_squads_to_update, (amount_to_update,)).fetchall()
+        squads_id_to_update: list = utils.fetch_all(db, sql_requests.select_squads_to_update, (amount_to_update,))
+
+    if collector.ASYNC_COLLECTOR:
+        logger.info(f'Updating {len(squads_id_to_update)} squadrons by async collector')
+        collector.collect(
+            [single_squad_to_update[0] for single_squad_to_update in squads_id_to_update],
+            db,
+            should_stop=lambda: shutting_down
+        )
+        return
 
     for single_squad_to_update in squads_id_to_update:  # if db is empty, then loop will not happen
 
@@ -202,7 +286,11 @@ if __name__ == '__main__':
     main.py update
     main.py update amount <amount: int>
     main.py update id <id: int>
-    main.py daemon"""
+    main.py daemon
+    main.py compact states
+    main.py compact news
+    main.py archive
+    main.py history <squads_states|news> <id: int>"""
 
     logger.debug(f'argv: {sys.argv}')
 
@@ -226,26 +314,37 @@ if __name__ == '__main__':
         elif sys.argv[1] == 'daemon':
             # main.py daemon
             logger.info('Entering daemon mode')
-            while True:
-                can_be_shutdown = False
+            # runs continuously within requests budget, checks shutting_down at least every second
+            daemon_scheduler.DaemonScheduler(db).run(should_stop=lambda: shutting_down)
+            exit(0)
 
-                update(amount_to_update=500, thursday_target=False)
-                if shutting_down:
-                    exit(0)
+        elif sys.argv[1] == 'archive':
+            # main.py archive
+            logger.info('Entering archive mode')
+            for table_name in archive.ARCHIVED_TABLES:
+                archived: int = archive.archive_table(db, table_name)  # batches are submitted to utils.WRITER
+                logger.info(f'{table_name} archived, {archived} rows moved to {archive.ARCHIVE_DIR}')
 
-                logger.info('Updated, sleeping')
-                can_be_shutdown = True
-                time.sleep(30 * 60)
-                can_be_shutdown = False
-                logger.info('Discovering')
+            exit(0)
 
-                discover(back_count=20)
-                if shutting_down:
-                    exit(0)
+        else:
+            print(help_cli())
+            exit(1)
 
-                logger.info('Discovered, sleeping')
-                can_be_shutdown = True
-                time.sleep(30 * 60)
+    elif len(sys.argv) == 3:
+        if sys.argv[1] == 'compact' and sys.argv[2] == 'states':
+            # main.py compact states
+            logger.info('Entering squads_states compacting mode')
+            deleted: int = utils.compact_squads_states(db)
+            logger.info(f'squads_states compacted, {deleted} rows deleted')
+            exit(0)
+
+        elif sys.argv[1] == 'compact' and sys.argv[2] == 'news':
+            # main.py compact news
+            logger.info('Entering news compacting mode')
+            deleted: int = utils.compact_news(db)
+            logger.info(f'news compacted, {deleted} rows deleted')
+            exit(0)
 
         else:
             print(help_cli())
@@ -281,6 +380,24 @@ if __name__ == '__main__':
             else:
                 logger.info(f'Unknown argument {sys.argv[2]}')
 
+        elif sys.argv[1] == 'history' and sys.argv[2] in archive.ARCHIVED_TABLES:
+            # main.py history <squads_states|news> <id: int>
+            try:
+                history_squad_id: int = int(sys.argv[3])
+
+            except ValueError:
+                print('ID must be integer')
+                exit(1)
+
+            for record in archive.squad_history(db, sys.argv[2], history_squad_id):
+                print(json.dumps(record, ensure_ascii=False))
+
+            exit(0)
+
+        else:
+            print(help_cli())
+            exit(1)
+
     else:
         print(help_cli())
         exit(1)
@@ -63,6 +63,34 @@ class SqliteModel:
             query = sqlite_sql_requests.squads_by_tag_extended_raw_keys
 
         squads = self.db.execute(query, {'tag': tag}).fetchall()
+        return self._prepare_squads(squads, pretty_keys, motd, resolve_tags, extended)
+
+    def list_squads_by_user_tags(self, tag_ids: list[int], min_members: int = 0, pretty_keys=False, motd=False,
+                                 resolve_tags=False, extended=False) -> list:
+        """
+        Take user tags ids and return all squads which have all of them, i.e. [32] for russian squads
+
+        :param tag_ids: ServerUniqueId of tags from available.json
+        :param min_members: return only squads with at least that members
+        :param extended: if false, then we don't return tags and motd anyway
+        :param motd: if we should return motd with information
+        :param resolve_tags: if we should resolve tags or return it as plain list of IDs
+        :param pretty_keys: if we should use pretty keys or raw column names from DB
+        :return:
+        """
+
+        if len(tag_ids) == 0:
+            return list()
+
+        squads = self.db.execute(
+            sqlite_sql_requests.squads_by_user_tags_extended_raw_keys,
+            {'tag_ids': json.dumps(tag_ids), 'min_members': min_members}
+        ).fetchall()
+
+        return self._prepare_squads(squads, pretty_keys, motd, resolve_tags, extended)
+
+    def _prepare_squads(self, squads: list[dict], pretty_keys: bool, motd: bool, resolve_tags: bool,
+                        extended: bool) -> list:
         squad: dict
         for squad in squads:
             squad['user_tags'] = json.loads(squad['user_tags'])
@@ -10,11 +10,13 @@ squads_by_tag_extended_raw_keys = """select
     null_fdev(super_power_name) as super_power_name,
     null_fdev(faction_name) as faction_name,
     user_tags,
-    max(inserted_timestamp) as inserted_timestamp,
+    coalesce(
+        (select checked_timestamp from squads_last_checked where squads_last_checked.squad_id = squads_current.squad_id),
+        max(inserted_timestamp)
+    ) as inserted_timestamp,
     squad_id
-from squads_states 
+from squads_current 
 where tag = :tag 
-and squad_id not in (select squad_id from squads_states where tag is null)
 group by platform 
 order by platform;
 """
@@ -31,11 +33,13 @@ squads_by_tag_pattern_extended_raw_keys = """select
     null_fdev(super_power_name) as super_power_name,
     null_fdev(faction_name) as faction_name,
     user_tags,
-    max(inserted_timestamp) as inserted_timestamp,
+    coalesce(
+        (select checked_timestamp from squads_last_checked where squads_last_checked.squad_id = squads_current.squad_id),
+        max(inserted_timestamp)
+    ) as inserted_timestamp,
     squad_id
-from squads_states 
+from squads_current 
 where tag like :tag 
-and squad_id not in (select squad_id from squads_states where tag is null)
 group by platform 
 order by platform;
 """
@@ -58,3 +62,35 @@ from news
 where cmdr_id = :fid 
 order by date desc 
 limit 1;"""
+
+# squads which have all of :tag_ids (json list), index lookups by the first tag and checks of the rest
+squads_by_user_tags_extended_raw_keys = """select 
+    name,
+    tag,
+    member_count,
+    owner_name,
+    owner_id,
+    platform,
+    created,
+    null_fdev(power_name) as power_name,
+    null_fdev(super_power_name) as super_power_name,
+    null_fdev(faction_name) as faction_name,
+    user_tags,
+    coalesce(
+        (select checked_timestamp from squads_last_checked where squads_last_checked.squad_id = squads_current.squad_id),
+        squads_current.inserted_timestamp
+    ) as inserted_timestamp,
+    squads_current.squad_id
+from squads_current_tags inner join squads_current on squads_current.squad_id = squads_current_tags.squad_id 
+where 
+    squads_current_tags.tag_id = json_extract(:tag_ids, '$[0]') and 
+    not exists (
+        select * 
+        from json_each(:tag_ids) 
+        where not exists (
+            select * 
+            from squads_current_tags as other_tag 
+            where other_tag.tag_id = json_each.value and other_tag.squad_id = squads_current.squad_id)) and 
+    squads_current.member_count >= :min_members 
+order by squads_current_tags.squad_id;
+"""
@@ -0,0 +1,173 @@
+"""
+Proxy scheduler
+
+Proxies live in priority queue (heapq) keyed by time when proxy becomes eligible for next request, ties are broken
+by proxy's average latency. Every request reports its outcome back, so scheduler tracks success rate and latency for
+every proxy. Failing proxy gets exponential backoff and after PROXY_QUARANTINE_AFTER failures in a row it's
+quarantined: the only request it gets is a probe once backoff elapsed, successful probe re-admits the proxy.
+
+Usage:
+    proxy = scheduler.acquire()  # blocks until some proxy is eligible
+    ... perform request through proxy.url ...
+    scheduler.release(proxy, success, latency)
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+import typing
+from typing import Union
+
+from EDMCLogging import get_main_logger
+
+logger = get_main_logger()
+
+PROXY_MAX_BACKOFF: float = float(os.getenv('JUBILANT_PROXY_MAX_BACKOFF', 10 * 60))
+PROXY_QUARANTINE_AFTER: int = int(os.getenv('JUBILANT_PROXY_QUARANTINE_AFTER', 3))
+HEALTH_SMOOTHING: float = 0.1  # weight of the latest request in success rate and latency averages
+
+logger.debug(f'PROXY_MAX_BACKOFF = {PROXY_MAX_BACKOFF}, PROXY_QUARANTINE_AFTER = {PROXY_QUARANTINE_AFTER}')
+
+
+class ProxyState:
+    def __init__(self, proxy: dict):
+        self.proxy = proxy  # entry of PROXIES_DICT
+        self.next_eligible: float = proxy.get('last_try', 0)
+        self.in_use: bool = False
+        self.failures: int = 0  # in a row
+        self.quarantined: bool = False
+        self.success_rate: float = 1.0
+        self.latency: float = 0.0
+        self.requests: int = 0
+
+    @property
+    def url(self) -> Union[str, None]:
+        return self.proxy['url']
+
+    def __repr__(self) -> str:
+        return f'<ProxyState {self.url} success_rate={self.success_rate:.2f} latency={self.latency:.2f}s ' \
+               f'failures={self.failures} quarantined={self.quarantined}>'
+
+
+class ProxyScheduler:
+    def __init__(self, proxies: list[dict], cooldown: float):
+        """
+        :param proxies: PROXIES_DICT
+        :param cooldown: time between requests through one proxy, TIME_BETWEEN_REQUESTS
+        """
+
+        self.cooldown = cooldown
+        self.states: list[ProxyState] = [ProxyState(proxy) for proxy in proxies]
+
+        self._by_proxy: dict[int, ProxyState] = {id(state.proxy): state for state in self.states}
+        self._heap: list[tuple[float, float, int, ProxyState]] = list()
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+
+        for state in self.states:
+            self._push(state)
+
+    def acquire(self, proxy: dict = None, exclude: typing.Collection[dict] = ()) -> ProxyState:
+        """Blocks until proxy is eligible for request and marks it as used
+
+        :param proxy: entry of PROXIES_DICT to wait for, if None then the earliest eligible proxy is taken
+        :param exclude: entries of PROXIES_DICT which shouldn't be taken, ignored if it would exclude all proxies
+        :return: state of acquired proxy, pass it to release after request
+        """
+
+        with self._condition:
+            while True:
+                if proxy is not None:
+                    state = self._by_proxy[id(proxy)]
+                    if state.in_use:
+                        self._condition.wait()
+                        continue
+
+                else:
+                    state = self._peek(exclude)
+                    if state is None:  # all proxies are in use
+                        self._condition.wait()
+                        continue
+
+                time_to_sleep: float = state.next_eligible - time.time()
+                if time_to_sleep > 0:
+                    # wakes up earlier if some proxy released
+                    self._condition.wait(timeout=time_to_sleep)
+                    continue
+
+                state.in_use = True  # heap entry of it becomes stale and will be skipped
+                if state.quarantined:
+                    logger.info(f'Probing quarantined proxy {state.url}')
+
+                return state
+
+    def release(self, state: ProxyState, success: bool, latency: float = 0.0) -> None:
+        """Returns proxy to queue with respect of request outcome
+
+        :param state: state returned by acquire
+        :param success: False if request failed because of proxy (connection error, timeout)
+        :param latency: how long request took
+        :return:
+        """
+
+        with self._condition:
+            now = time.time()
+            state.in_use = False
+            state.requests += 1
+            state.proxy['last_try'] = now
+            state.success_rate += HEALTH_SMOOTHING * (float(success) - state.success_rate)
+
+            if success:
+                state.latency += HEALTH_SMOOTHING * (latency - state.latency)
+                if state.quarantined:
+                    logger.info(f'Proxy {state.url} passed probe, re-admitting it')
+
+                state.failures = 0
+                state.quarantined = False
+                state.next_eligible = now + self.cooldown
+
+            else:
+                state.failures += 1
+                backoff: float = min(self.cooldown * 2 ** state.failures, PROXY_MAX_BACKOFF)
+                state.next_eligible = now + backoff
+
+                if state.failures >= PROXY_QUARANTINE_AFTER and not state.quarantined:
+                    state.quarantined = True
+                    logger.warning(f'Proxy {state.url} failed {state.failures} times in a row, quarantining it')
+
+                logger.debug(f'Proxy {state.url} backoff {backoff} s, {state}')
+
+            self._push(state)
+            self._condition.notify_all()
+
+    def _push(self, state: ProxyState) -> None:
+        heapq.heappush(self._heap, (state.next_eligible, state.latency, next(self._counter), state))
+
+    def _peek(self, exclude: typing.Collection[dict]) -> Union[ProxyState, None]:
+        # must be called under lock, drops stale entries, returns the earliest eligible proxy
+        excluded_ids: set[int] = {id(proxy) for proxy in exclude}
+        if all(id(state.proxy) in excluded_ids for state in self.states):
+            excluded_ids = set()
+
+        skipped: list[tuple[float, float, int, ProxyState]] = list()
+        found: Union[ProxyState, None] = None
+
+        while len(self._heap) != 0:
+            entry = self._heap[0]
+            state = entry[3]
+            if state.in_use or entry[0] != state.next_eligible:  # stale entry
+                heapq.heappop(self._heap)
+                continue
+
+            if id(state.proxy) in excluded_ids:
+                skipped.append(heapq.heappop(self._heap))
+                continue
+
+            found = state
+            break
+
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+
+        return found
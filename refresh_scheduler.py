@@ -0,0 +1,108 @@
+"""
+Volatility-aware refresh scheduling
+
+Every refresh of a squad compares the new state with the previous one and updates squad's change score, that is
+exponential moving average of "did anything important change": member count, season scores, tags or motd.
+From change score, member count and activity the next due time is computed, squads_refresh table keeps it and
+update mode takes squads in due order, so our requests go to squads which actually change.
+"""
+import math
+import os
+import sqlite3
+from typing import Union
+
+import sql_requests
+from EDMCLogging import get_main_logger
+
+logger = get_main_logger()
+
+REFRESH_MIN_INTERVAL: float = float(os.getenv('JUBILANT_REFRESH_MIN_INTERVAL', 6 * 60 * 60))
+REFRESH_MAX_INTERVAL: float = float(os.getenv('JUBILANT_REFRESH_MAX_INTERVAL', 14 * 24 * 60 * 60))
+CHANGE_SCORE_SMOOTHING: float = 0.3  # weight of the latest refresh in change score
+INITIAL_CHANGE_SCORE: float = 0.5  # for squads we see first time
+MEMBERS_SATURATION: int = 500  # squads with more members don't get more priority for size
+
+logger.debug(f'REFRESH_MIN_INTERVAL = {REFRESH_MIN_INTERVAL}, REFRESH_MAX_INTERVAL = {REFRESH_MAX_INTERVAL}')
+
+_TRACKED_COLUMNS: dict[str, list[int]] = {
+    'members': [sql_requests.SQUAD_STATE_COLUMNS.index('member_count')],
+    'scores': [
+        sql_requests.SQUAD_STATE_COLUMNS.index(column) for column in sql_requests.SQUAD_STATE_COLUMNS
+        if column.startswith('current_season_')
+    ],
+    'tags': [sql_requests.SQUAD_STATE_COLUMNS.index('tag'), sql_requests.SQUAD_STATE_COLUMNS.index('user_tags')]
+}
+
+
+def detect_changes(previous_state: Union[tuple, None], new_state: tuple, motd_changed: bool) -> list[str]:
+    """Returns list of tracked groups which changed between two squads_states rows
+
+    :param previous_state: previous squads_states row, None if squad is new for us
+    :param new_state: new squads_states row
+    :param motd_changed:
+    :return:
+    """
+
+    if previous_state is None:
+        return list()
+
+    changed: list[str] = [
+        group for group, indexes in _TRACKED_COLUMNS.items()
+        if any(previous_state[index] != new_state[index] for index in indexes)
+    ]
+
+    if motd_changed:
+        changed.append('motd')
+
+    return changed
+
+
+def refresh_interval(change_score: float, member_count: int, is_active: bool) -> float:
+    """Computes how long we can wait before next refresh of squad
+
+    :param change_score: 0..1, how often squad changes
+    :param member_count:
+    :param is_active: if squad earns any score in current season
+    :return: seconds
+    """
+
+    size: float = min(1.0, math.log1p(max(member_count or 0, 0)) / math.log1p(MEMBERS_SATURATION))
+    priority: float = 0.6 * change_score + 0.3 * size + 0.1 * float(is_active)
+
+    return REFRESH_MAX_INTERVAL - (REFRESH_MAX_INTERVAL - REFRESH_MIN_INTERVAL) * priority
+
+
+def record_refresh(
+        squad_id: int,
+        previous_state: Union[tuple, None],
+        new_state: tuple,
+        motd_changed: bool,
+        db_conn: sqlite3.Connection) -> None:
+    """Updates change score and next due time of squad, call it in the same transaction as state inserting
+
+    :param squad_id:
+    :param previous_state: squads_states row before the refresh, None if squad is new for us
+    :param new_state: inserted squads_states row
+    :param motd_changed:
+    :param db_conn:
+    :return:
+    """
+
+    changed: list[str] = detect_changes(previous_state, new_state, motd_changed)
+
+    sql_req = db_conn.execute(sql_requests.select_change_score, (squad_id,)).fetchone()
+    if previous_state is None or sql_req is None:
+        change_score: float = INITIAL_CHANGE_SCORE
+
+    else:
+        change_score: float = sql_req[0] + CHANGE_SCORE_SMOOTHING * (float(len(changed) != 0) - sql_req[0])
+
+    columns = sql_requests.SQUAD_STATE_COLUMNS
+    member_count: int = new_state[columns.index('member_count')]
+    is_active: bool = any(
+        new_state[index] for index, column in enumerate(columns) if column.startswith('current_season_'))
+
+    interval: float = refresh_interval(change_score, member_count, is_active)
+    logger.debug(f'{squad_id} changed: {changed}, change_score: {change_score:.3f}, next refresh in {interval:.0f} s')
+
+    db_conn.execute(sql_requests.upsert_squad_refresh, (squad_id, change_score, f'+{int(interval)} seconds'))
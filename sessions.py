@@ -0,0 +1,93 @@
+"""
+Pool of long lived keep-alive sessions, one per proxy from utils.PROXIES_DICT
+
+Reusing connections saves TCP + TLS handshake through proxy (ssh -D tunnels especially) on every FAPI request.
+Pool tracks consecutive failures for every session, once session fails SESSION_MAX_FAILURES times in a row it gets
+closed and built again on next request, so dead tunnel doesn't keep broken connections forever.
+"""
+import os
+import threading
+from typing import Union
+
+import requests
+import requests.adapters
+
+from EDMCLogging import get_main_logger
+
+logger = get_main_logger()
+
+CONNECT_TIMEOUT: float = float(os.getenv('JUBILANT_CONNECT_TIMEOUT', 10))
+READ_TIMEOUT: float = float(os.getenv('JUBILANT_READ_TIMEOUT', 30))
+SESSION_POOL_MAXSIZE: int = int(os.getenv('JUBILANT_SESSION_POOL_MAXSIZE', 4))
+SESSION_MAX_FAILURES: int = int(os.getenv('JUBILANT_SESSION_MAX_FAILURES', 2))
+
+logger.debug(f'CONNECT_TIMEOUT = {CONNECT_TIMEOUT}, READ_TIMEOUT = {READ_TIMEOUT}, '
+             f'SESSION_POOL_MAXSIZE = {SESSION_POOL_MAXSIZE}, SESSION_MAX_FAILURES = {SESSION_MAX_FAILURES}')
+
+
+class SessionPool:
+    def __init__(self, pool_maxsize: int = SESSION_POOL_MAXSIZE, max_failures: int = SESSION_MAX_FAILURES):
+        self.pool_maxsize = pool_maxsize
+        self.max_failures = max_failures
+        self.timeout: tuple[float, float] = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+        self._sessions: dict[Union[str, None], requests.Session] = dict()
+        self._failures: dict[Union[str, None], int] = dict()
+        self._lock = threading.Lock()
+
+    def get(self, proxy_url: Union[str, None]) -> requests.Session:
+        """Returns session for specified proxy, builds new one if there is no alive session
+
+        :param proxy_url: url of proxy, as in PROXIES_DICT, None for direct connection
+        :return:
+        """
+
+        with self._lock:
+            session = self._sessions.get(proxy_url)
+            if session is None:
+                session = self._build(proxy_url)
+                self._sessions[proxy_url] = session
+                self._failures[proxy_url] = 0
+
+            return session
+
+    def report_success(self, proxy_url: Union[str, None]) -> None:
+        with self._lock:
+            self._failures[proxy_url] = 0
+
+    def report_failure(self, proxy_url: Union[str, None]) -> None:
+        """Counts failure of session for specified proxy, rebuilds session if it fails too often
+
+        :param proxy_url:
+        :return:
+        """
+
+        with self._lock:
+            self._failures[proxy_url] = self._failures.get(proxy_url, 0) + 1
+
+            if self._failures[proxy_url] >= self.max_failures and proxy_url in self._sessions:
+                logger.info(f'Session for {proxy_url} proxy failed {self._failures[proxy_url]} times in a row, '
+                            f'rebuilding it')
+                self._sessions.pop(proxy_url).close()
+                self._failures[proxy_url] = 0
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+
+            self._sessions.clear()
+
+    def _build(self, proxy_url: Union[str, None]) -> requests.Session:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1,  # every session talks to FAPI host only
+            pool_maxsize=self.pool_maxsize,
+            max_retries=0  # retries are handled by utils.proxied_request
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        # proxy isn't set on session: requests merges HTTP(S)_PROXY envs over session.proxies, so
+        # utils.proxied_request passes proxies with every request instead
+
+        return session
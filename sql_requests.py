@@ -1,3 +1,46 @@
+# columns of squads_states in insert_squad_states and select_last_squad_state order
+SQUAD_STATE_COLUMNS: tuple = (
+    'squad_id',
+    'name',
+    'tag',
+    'owner_name',
+    'owner_id',
+    'platform',
+    'created',
+    'created_ts',
+    'accepting_new_members',
+    'power_id',
+    'power_name',
+    'super_power_id',
+    'super_power_name',
+    'faction_id',
+    'faction_name',
+    'user_tags',
+    'member_count',
+    'pending_count',
+    'full',
+    'public_comms',
+    'public_comms_override',
+    'public_comms_available',
+    'current_season_trade_score',
+    'previous_season_trade_score',
+    'current_season_combat_score',
+    'previous_season_combat_score',
+    'current_season_exploration_score',
+    'previous_season_exploration_score',
+    'current_season_cqc_score',
+    'previous_season_cqc_score',
+    'current_season_bgs_score',
+    'previous_season_bgs_score',
+    'current_season_powerplay_score',
+    'previous_season_powerplay_score',
+    'current_season_aegis_score',
+    'previous_season_aegis_score'
+)
+
+# columns of squads_states stored as references to state_strings, see sql_schema.sql
+ENCODED_STATE_COLUMNS: tuple = ('name', 'owner_name', 'platform', 'power_name', 'super_power_name', 'faction_name')
+
 insert_squad_states: str = """insert into squads_states (
     squad_id, 
     name, 
@@ -49,27 +92,40 @@ bookmark,
 motd,
 author,
 cmdr_id,
-user_id)
-values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);"""
+user_id,
+last_seen)
+values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, current_timestamp);"""
 
-check_if_squad_exists_in_db: str = """select count(*) 
-from squads_states
-where squad_id = ?;"""
+# requires idx_news_unique, news are immutable, so known news only get last_seen updated
+upsert_news: str = """insert into news (
+squad_id,
+type_of_news,
+news_id,
+date,
+category,
+activity,
+season,
+bookmark,
+motd,
+author,
+cmdr_id,
+user_id,
+last_seen)
+values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, current_timestamp) 
+on conflict (squad_id, type_of_news, ifnull(news_id, -1)) do update set last_seen = excluded.last_seen;"""
 
 properly_delete_squad: str = """insert into squads_states (squad_id) values (?);"""
 
-check_if_we_already_deleted_squad_in_db: str = """select count(*) 
-from squads_states 
-where squad_id = ? and tag is null"""
-
-select_last_known_id: str = """select squad_id 
-from squads_states 
-order by squad_id desc
-limit 1;"""
+select_squads_to_update: str = """select squads_refresh.squad_id 
+from squads_refresh inner join squads_current on squads_refresh.squad_id = squads_current.squad_id 
+order by squads_refresh.next_due asc
+limit ?;"""
 
-select_squads_to_update: str = """select squad_id 
-from squads_view
-order by inserted_timestamp asc
+# refresh work of daemon, squads not due yet don't take budget from other work, see daemon_scheduler.py
+select_due_squads_to_update: str = """select squads_refresh.squad_id 
+from squads_refresh inner join squads_current on squads_refresh.squad_id = squads_current.squad_id 
+where squads_refresh.next_due <= current_timestamp 
+order by squads_refresh.next_due asc
 limit ?;"""
 
 select_new_squads_to_update: str = """select squad_id 
@@ -77,19 +133,6 @@ from squads_view
 order by squad_id desc
 limit ?;"""
 
-select_first_hole_id: str = """select squad_id+1 as a 
-from squads_states except 
-    select squad_id 
-    from squads_states 
-    order by a asc 
-    limit 1;"""
-
-select_old_new: str = """select {column}
-from squads_states
-where squad_id = ?
-order by inserted_timestamp desc
-limit 2;"""
-
 # AAAAAAAAA, it require to do something with it
 # select_old_new_news: str = """select {column}
 # from squads_states inner join news on
@@ -98,18 +141,262 @@ limit 2;"""
 # where category = 'Squadrons_History_Category_PublicStatement' and squads_states.squad_id = ?
 # order by squads_states.inserted_timestamp
 # limit 2;"""
-select_new_old_news: str = """select {column} 
-from news 
-where squad_id = ? and type_of_news = 'public_statements' 
-order by inserted_timestamp desc 
-limit 2;"""
 
 select_important_before_delete: str = """select name, platform, member_count, tag, user_tags, created, owner_name 
 from squads_view 
 where squad_id = ?;"""
 
-select_squads_to_update_thursday_aimed: str = """select squad_id 
-from squads_view 
-where inserted_timestamp < ?
-order by inserted_timestamp asc
+check_squad_has_user_tag: str = """select count(*) 
+from squads_current_tags 
+where tag_id = ? and squad_id = ?;"""
+
+select_squads_to_update_thursday_aimed: str = """select squads_last_checked.squad_id 
+from squads_last_checked inner join squads_current on squads_last_checked.squad_id = squads_current.squad_id 
+where squads_last_checked.checked_timestamp < ?
+order by squads_last_checked.checked_timestamp asc
+limit ?;"""
+
+select_last_squad_state: str = """select squad_id, 
+    name, 
+    tag, 
+    owner_name, 
+    owner_id, 
+    platform, 
+    created, 
+    created_ts, 
+    accepting_new_members, 
+    power_id, 
+    power_name, 
+    super_power_id, 
+    super_power_name, 
+    faction_id, 
+    faction_name, 
+    user_tags, 
+    member_count, 
+    pending_count, 
+    full, 
+    public_comms, 
+    public_comms_override, 
+    public_comms_available, 
+    current_season_trade_score, 
+    previous_season_trade_score, 
+    current_season_combat_score, 
+    previous_season_combat_score, 
+    current_season_exploration_score, 
+    previous_season_exploration_score, 
+    current_season_cqc_score, 
+    previous_season_cqc_score, 
+    current_season_bgs_score, 
+    previous_season_bgs_score, 
+    current_season_powerplay_score, 
+    previous_season_powerplay_score, 
+    current_season_aegis_score, 
+    previous_season_aegis_score 
+from squads_states 
+where squad_id = ? 
+order by inserted_timestamp desc 
+limit 1;"""
+
+select_news_age: str = """select (julianday('now') - julianday(max(coalesce(last_seen, inserted_timestamp)))) * 86400 
+from news 
+where squad_id = ?;"""
+
+# the latest statement of the latest news request
+select_last_motd: str = """select motd 
+from news 
+where squad_id = ? and type_of_news = 'public_statements' 
+order by coalesce(last_seen, inserted_timestamp) desc, date desc 
+limit 1;"""
+
+select_change_score: str = """select change_score 
+from squads_refresh 
+where squad_id = ?;"""
+
+upsert_squad_refresh: str = """insert into squads_refresh (squad_id, change_score, next_due) 
+values (?, ?, datetime('now', ?)) 
+on conflict (squad_id) do update set 
+    change_score = excluded.change_score, 
+    next_due = excluded.next_due, 
+    updated_timestamp = current_timestamp;"""
+
+select_known_id_ranges: str = """select range_start, range_end 
+from known_id_ranges 
+order by range_start;"""
+
+select_all_deleted_ids: str = """select distinct squad_id 
+from squads_states 
+where tag is null;"""
+
+select_discover_checkpoint: str = """select cursor, tries, failed 
+from discover_checkpoint 
+where id = 0;"""
+
+upsert_discover_checkpoint: str = """insert into discover_checkpoint (id, cursor, tries, failed) 
+values (0, ?, ?, ?) 
+on conflict (id) do update set 
+    cursor = excluded.cursor, 
+    tries = excluded.tries, 
+    failed = excluded.failed, 
+    updated_timestamp = current_timestamp;"""
+
+delete_discover_checkpoint: str = """delete from discover_checkpoint;"""
+
+
+upsert_squad_last_checked: str = """insert into squads_last_checked (squad_id, checked_timestamp) 
+values (?, current_timestamp) 
+on conflict (squad_id) do update set checked_timestamp = excluded.checked_timestamp;"""
+
+# for compacting squads_states
+backfill_squads_last_checked: str = """insert into squads_last_checked (squad_id, checked_timestamp) 
+select squad_id, max(inserted_timestamp) 
+from squads_states 
+where true  -- avoids parsing ambiguity of upsert after select
+group by squad_id 
+on conflict (squad_id) do update set checked_timestamp = max(checked_timestamp, excluded.checked_timestamp);"""
+
+select_all_squad_states: str = """select state_id, {columns} 
+from squads_states 
+order by squad_id, inserted_timestamp, state_id;""".format(columns=', '.join(SQUAD_STATE_COLUMNS))
+
+delete_squad_states_by_rowid: str = """delete from squads_states_data where state_id = ?;"""
+
+vacuum: str = """vacuum;"""
+
+# news deduplication, see utils.prepare_news_storage and utils.compact_news
+select_news_columns: str = """pragma table_info(news);"""
+
+add_news_last_seen: str = """alter table news add column last_seen datetime;"""
+
+create_news_unique_index: str = """create unique index if not exists idx_news_unique 
+on news (squad_id, type_of_news, ifnull(news_id, -1));"""
+
+create_news_indexes: str = """
+-- select_news_age
+create index if not exists idx_news_1 on news (squad_id, coalesce(last_seen, inserted_timestamp));
+
+-- select_last_motd
+create index if not exists idx_news_2 on news (squad_id, type_of_news, coalesce(last_seen, inserted_timestamp), date);
+
+-- web: select_latest_motd_by_id
+create index if not exists idx_news_3 on news (squad_id, type_of_news, date);
+
+-- web: select_nickname_by_fid_news_based
+create index if not exists idx_news_4 on news (cmdr_id, date) where cmdr_id is not null;"""
+
+select_news_count: str = """select count(*) from news;"""
+
+check_news_unique_index: str = """select count(*) 
+from sqlite_master 
+where type = 'index' and name = 'idx_news_unique';"""
+
+# keeps the first row of every news with last time it was seen
+compact_news: str = """begin;
+
+create temp table news_keep as 
+    select min(rowid) as keep_rowid, max(coalesce(last_seen, inserted_timestamp)) as last_seen 
+    from news 
+    group by squad_id, type_of_news, ifnull(news_id, -1);
+
+update news 
+set last_seen = (select news_keep.last_seen from news_keep where news_keep.keep_rowid = news.rowid) 
+where rowid in (select keep_rowid from news_keep);
+
+delete from news 
+where rowid not in (select keep_rowid from news_keep);
+
+drop table news_keep;
+
+commit;"""
+# archive, see archive.py
+# rows older than horizon except the latest state of every squad, hooks and change-only states compare with it
+select_squad_states_to_archive: str = """select state_id, {columns}, inserted_timestamp 
+from squads_states 
+where state_id > ? and inserted_timestamp < datetime('now', ?) and inserted_timestamp < (
+    select max(latest.inserted_timestamp) 
+    from squads_states_data as latest 
+    where latest.squad_id = squads_states.squad_id) 
+order by state_id 
+limit ?;""".format(columns=', '.join(SQUAD_STATE_COLUMNS))
+
+# news not seen for longer than horizon except the latest statement of every squad, see select_last_motd
+select_news_to_archive: str = """select rowid, * 
+from news 
+where rowid > ? and coalesce(last_seen, inserted_timestamp) < datetime('now', ?) and not (
+    type_of_news = 'public_statements' and coalesce(last_seen, inserted_timestamp) >= (
+        select max(coalesce(latest.last_seen, latest.inserted_timestamp)) 
+        from news as latest 
+        where latest.squad_id = news.squad_id and latest.type_of_news = 'public_statements')) 
+order by rowid 
 limit ?;"""
+
+delete_news_by_rowid: str = """delete from news where rowid = ?;"""
+
+insert_archive_index: str = """insert or ignore into archive_index 
+(table_name, squad_id, archive_file, member_offset, member_length) 
+values (?, ?, ?, ?, ?);"""
+
+select_archive_members: str = """select archive_file, member_offset, member_length 
+from archive_index 
+where table_name = ? and squad_id = ? 
+order by archive_file, member_offset;"""
+
+# dictionary encoded squads_states, see sql_schema.sql and utils.encode_legacy_squads_states
+select_squads_states_type: str = """select type 
+from sqlite_master 
+where name = 'squads_states';"""
+
+rename_legacy_squads_states: str = """
+alter table squads_states rename to squads_states_legacy;
+
+-- triggers moved with the table, schema creates them on the view
+drop trigger if exists squads_states_to_current;
+drop trigger if exists squads_states_to_current_tags;
+drop trigger if exists squads_states_to_known_id_ranges;"""
+
+check_legacy_squads_states: str = """select count(*) 
+from sqlite_master 
+where type = 'table' and name = 'squads_states_legacy';"""
+
+encode_legacy_squads_states: str = """
+begin;
+
+insert or ignore into state_strings (value)
+select value 
+from (
+    select name as value from squads_states_legacy 
+    union all select owner_name from squads_states_legacy 
+    union all select platform from squads_states_legacy 
+    union all select power_name from squads_states_legacy 
+    union all select super_power_name from squads_states_legacy 
+    union all select faction_name from squads_states_legacy) 
+where value is not null;
+
+-- state_id keeps rowid and so the order of rows
+insert into squads_states_data (state_id, {data_columns}) 
+select rowid, {encoded_columns} 
+from squads_states_legacy 
+order by rowid;
+
+drop table squads_states_legacy;
+
+commit;""".format(
+    data_columns=', '.join(
+        f'{column}_id' if column in ENCODED_STATE_COLUMNS else column for column in SQUAD_STATE_COLUMNS
+    ) + ', inserted_timestamp',
+    encoded_columns=', '.join(
+        f'(select string_id from state_strings where value = squads_states_legacy.{column})' if column in ENCODED_STATE_COLUMNS else column
+        for column in SQUAD_STATE_COLUMNS
+    ) + ', inserted_timestamp'
+)
+
+# discord notifications, see discord_outbox.py
+insert_discord_outbox: str = """insert into discord_outbox (content) values (?);"""
+
+select_discord_outbox: str = """select message_id, content, attempts 
+from discord_outbox 
+order by message_id 
+limit ?;"""
+
+delete_discord_outbox: str = """delete from discord_outbox where message_id = ?;"""
+
+increment_discord_outbox_attempts: str = """update discord_outbox set attempts = attempts + 1 where message_id = ?;"""
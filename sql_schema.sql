@@ -1,5 +1,189 @@
-create table if not exists squads_states (
+-- repeating text of squads_states (names, platform, powers, factions) is stored once in state_strings,
+-- squads_states_data keeps references to it, squads_states view decodes them and its triggers encode inserts, so
+-- queries see the same columns as before. DBs created before it are moved by utils.encode_legacy_squads_states
+create table if not exists state_strings (
+string_id integer primary key,
+value text not null unique);
+
+create table if not exists squads_states_data (
+state_id integer primary key,
 squad_id int not null,
+name_id int,  -- state_strings
+tag text,
+owner_name_id int,  -- state_strings
+owner_id int,
+platform_id int,  -- state_strings
+created text,
+created_ts int,
+accepting_new_members bool,
+power_id int,
+power_name_id int,  -- state_strings
+super_power_id int,
+super_power_name_id int,  -- state_strings
+faction_id int,
+faction_name_id int,  -- state_strings
+user_tags text,
+member_count int,
+pending_count int,
+full bool,
+public_comms bool,
+public_comms_override bool,
+public_comms_available bool,
+current_season_trade_score int,
+previous_season_trade_score int,
+current_season_combat_score int,
+previous_season_combat_score int,
+current_season_exploration_score int,
+previous_season_exploration_score int,
+current_season_cqc_score int,
+previous_season_cqc_score int,
+current_season_bgs_score int,
+previous_season_bgs_score int,
+current_season_powerplay_score int,
+previous_season_powerplay_score int,
+current_season_aegis_score int,
+previous_season_aegis_score int,
+inserted_timestamp datetime default current_timestamp);
+
+create index if not exists idx_squads_states_data_0 on squads_states_data (squad_id, inserted_timestamp);  -- last states
+create index if not exists idx_squads_states_data_1 on squads_states_data (squad_id) where tag is null;  -- deleted
+
+create view if not exists squads_states
+as
+select state_id,
+squad_id,
+(select value from state_strings where string_id = name_id) as name,
+tag,
+(select value from state_strings where string_id = owner_name_id) as owner_name,
+owner_id,
+(select value from state_strings where string_id = platform_id) as platform,
+created,
+created_ts,
+accepting_new_members,
+power_id,
+(select value from state_strings where string_id = power_name_id) as power_name,
+super_power_id,
+(select value from state_strings where string_id = super_power_name_id) as super_power_name,
+faction_id,
+(select value from state_strings where string_id = faction_name_id) as faction_name,
+user_tags,
+member_count,
+pending_count,
+full,
+public_comms,
+public_comms_override,
+public_comms_available,
+current_season_trade_score,
+previous_season_trade_score,
+current_season_combat_score,
+previous_season_combat_score,
+current_season_exploration_score,
+previous_season_exploration_score,
+current_season_cqc_score,
+previous_season_cqc_score,
+current_season_bgs_score,
+previous_season_bgs_score,
+current_season_powerplay_score,
+previous_season_powerplay_score,
+current_season_aegis_score,
+previous_season_aegis_score,
+inserted_timestamp
+from squads_states_data;
+
+create trigger if not exists squads_states_insert instead of insert on squads_states
+begin
+    insert or ignore into state_strings (value)
+    select value
+    from (select new.name as value
+        union all select new.owner_name
+        union all select new.platform
+        union all select new.power_name
+        union all select new.super_power_name
+        union all select new.faction_name)
+    where value is not null;
+
+    insert into squads_states_data (
+        squad_id,
+        name_id,
+        tag,
+        owner_name_id,
+        owner_id,
+        platform_id,
+        created,
+        created_ts,
+        accepting_new_members,
+        power_id,
+        power_name_id,
+        super_power_id,
+        super_power_name_id,
+        faction_id,
+        faction_name_id,
+        user_tags,
+        member_count,
+        pending_count,
+        full,
+        public_comms,
+        public_comms_override,
+        public_comms_available,
+        current_season_trade_score,
+        previous_season_trade_score,
+        current_season_combat_score,
+        previous_season_combat_score,
+        current_season_exploration_score,
+        previous_season_exploration_score,
+        current_season_cqc_score,
+        previous_season_cqc_score,
+        current_season_bgs_score,
+        previous_season_bgs_score,
+        current_season_powerplay_score,
+        previous_season_powerplay_score,
+        current_season_aegis_score,
+        previous_season_aegis_score,
+        inserted_timestamp)
+    values (
+        new.squad_id,
+        (select string_id from state_strings where value = new.name),
+        new.tag,
+        (select string_id from state_strings where value = new.owner_name),
+        new.owner_id,
+        (select string_id from state_strings where value = new.platform),
+        new.created,
+        new.created_ts,
+        new.accepting_new_members,
+        new.power_id,
+        (select string_id from state_strings where value = new.power_name),
+        new.super_power_id,
+        (select string_id from state_strings where value = new.super_power_name),
+        new.faction_id,
+        (select string_id from state_strings where value = new.faction_name),
+        new.user_tags,
+        new.member_count,
+        new.pending_count,
+        new.full,
+        new.public_comms,
+        new.public_comms_override,
+        new.public_comms_available,
+        new.current_season_trade_score,
+        new.previous_season_trade_score,
+        new.current_season_combat_score,
+        new.previous_season_combat_score,
+        new.current_season_exploration_score,
+        new.previous_season_exploration_score,
+        new.current_season_cqc_score,
+        new.previous_season_cqc_score,
+        new.current_season_bgs_score,
+        new.previous_season_bgs_score,
+        new.current_season_powerplay_score,
+        new.previous_season_powerplay_score,
+        new.current_season_aegis_score,
+        new.previous_season_aegis_score,
+        coalesce(new.inserted_timestamp, current_timestamp));
+end;
+
+-- current state of every existing squad, maintained by squads_states_to_current trigger in the same transaction
+-- as squads_states insert, so we don't have to scan the whole history to get the latest state
+create table if not exists squads_current (
+squad_id int primary key,
 name text,
 tag text,
 owner_name text,
@@ -35,11 +219,161 @@ current_season_powerplay_score int,
 previous_season_powerplay_score int,
 current_season_aegis_score int,
 previous_season_aegis_score int,
-inserted_timestamp datetime default current_timestamp);
+current_season_score int,
+previous_season_score int,
+inserted_timestamp datetime);
+
+drop index if exists idx_squads_current_0;  -- replaced by idx_squads_current_2
+drop index if exists idx_squads_current_1;  -- thursday aimed update uses squads_last_checked
+create index if not exists idx_squads_current_2 on squads_current (tag, platform);  -- web: squads by tag
+
+-- properly deleted squad (all columns are null except squad_id) leaves squads_current
+create trigger if not exists squads_states_to_current instead of insert on squads_states
+begin
+    delete from squads_current where squad_id = new.squad_id and new.tag is null;
+
+    insert or replace into squads_current
+    select
+        new.squad_id,
+        new.name,
+        new.tag,
+        new.owner_name,
+        new.owner_id,
+        new.platform,
+        new.created,
+        new.created_ts,
+        new.accepting_new_members,
+        new.power_id,
+        new.power_name,
+        new.super_power_id,
+        new.super_power_name,
+        new.faction_id,
+        new.faction_name,
+        new.user_tags,
+        new.member_count,
+        new.pending_count,
+        new.full,
+        new.public_comms,
+        new.public_comms_override,
+        new.public_comms_available,
+        new.current_season_trade_score,
+        new.previous_season_trade_score,
+        new.current_season_combat_score,
+        new.previous_season_combat_score,
+        new.current_season_exploration_score,
+        new.previous_season_exploration_score,
+        new.current_season_cqc_score,
+        new.previous_season_cqc_score,
+        new.current_season_bgs_score,
+        new.previous_season_bgs_score,
+        new.current_season_powerplay_score,
+        new.previous_season_powerplay_score,
+        new.current_season_aegis_score,
+        new.previous_season_aegis_score,
+        new.current_season_trade_score +
+        new.current_season_combat_score +
+        new.current_season_exploration_score +
+        new.current_season_cqc_score +
+        new.current_season_bgs_score +
+        new.current_season_powerplay_score +
+        new.current_season_aegis_score as current_season_score,
+        new.previous_season_trade_score +
+        new.previous_season_combat_score +
+        new.previous_season_exploration_score +
+        new.previous_season_cqc_score +
+        new.previous_season_bgs_score +
+        new.previous_season_powerplay_score +
+        new.previous_season_aegis_score as previous_season_score,
+        coalesce(new.inserted_timestamp, current_timestamp)
+    where new.tag is not null;
+end;
+
+-- fills squads_current of DBs created before it, only once
+insert into squads_current
+select squad_id,
+name,
+tag,
+owner_name,
+owner_id,
+platform,
+created,
+created_ts,
+accepting_new_members,
+power_id,
+power_name,
+super_power_id,
+super_power_name,
+faction_id,
+faction_name,
+user_tags,
+member_count,
+pending_count,
+full,
+public_comms,
+public_comms_override,
+public_comms_available,
+current_season_trade_score,
+previous_season_trade_score,
+current_season_combat_score,
+previous_season_combat_score,
+current_season_exploration_score,
+previous_season_exploration_score,
+current_season_cqc_score,
+previous_season_cqc_score,
+current_season_bgs_score,
+previous_season_bgs_score,
+current_season_powerplay_score,
+previous_season_powerplay_score,
+current_season_aegis_score,
+previous_season_aegis_score,
+current_season_trade_score +
+current_season_combat_score +
+current_season_exploration_score +
+current_season_cqc_score +
+current_season_bgs_score +
+current_season_powerplay_score +
+current_season_aegis_score as current_season_score,
+previous_season_trade_score +
+previous_season_combat_score +
+previous_season_exploration_score +
+previous_season_cqc_score +
+previous_season_bgs_score +
+previous_season_powerplay_score +
+previous_season_aegis_score as previous_season_score, max(inserted_timestamp) as inserted_timestamp
+from (select * from squads_states
+    -- `where not exists` doesn't stop the scan, limit 0 does
+    limit case when exists (select * from squads_current) then 0 else -1 end)
+group by squad_id having tag is not null;
 
-create index if not exists idx_squads_states_1 on squads_states (tag) where tag is null;  --for squads_by_tag_extended_raw_keys req
+-- user tags of squads_current rows, one row per squad per tag, so squads can be selected by tag id with an index
+-- instead of decoding user_tags json of every squad
+create table if not exists squads_current_tags (
+tag_id int not null,  -- ServerUniqueId of available.json
+squad_id int not null,
+primary key (tag_id, squad_id)) without rowid;
+
+create index if not exists idx_squads_current_tags_0 on squads_current_tags (squad_id);
+
+create trigger if not exists squads_states_to_current_tags instead of insert on squads_states
+begin
+    delete from squads_current_tags where squad_id = new.squad_id;
+
+    insert or ignore into squads_current_tags (tag_id, squad_id)
+    select value, new.squad_id
+    from json_each(new.user_tags)
+    where new.tag is not null and json_valid(new.user_tags);
+end;
+
+-- fills squads_current_tags of DBs created before it, only once
+insert or ignore into squads_current_tags (tag_id, squad_id)
+select value, squad_id
+from (select squad_id, user_tags from squads_current where json_valid(user_tags)
+    -- `where not exists` doesn't stop the scan, limit 0 does
+    limit case when exists (select * from squads_current_tags) then 0 else -1 end), json_each(user_tags);
 
-create view if not exists squads_view
+drop view if exists squads_view;  -- old definition scans squads_states
+
+create view squads_view
 as
 select squad_id,
 name,
@@ -76,7 +410,8 @@ previous_season_bgs_score,
 current_season_powerplay_score,
 previous_season_powerplay_score,
 current_season_aegis_score,
-previous_season_aegis_score, max(inserted_timestamp) as inserted_timestamp from squads_states group by squad_id having tag is not null;
+previous_season_aegis_score, inserted_timestamp
+from squads_current;
 
 create table if not exists news (
 squad_id int,
@@ -91,7 +426,10 @@ motd text,
 author text,
 cmdr_id int,
 user_id int,
-inserted_timestamp datetime default current_timestamp);
+inserted_timestamp datetime default current_timestamp,  -- when news was seen first time
+last_seen datetime);  -- when news was seen last time, unique index on news is created by utils.prepare_news_storage
+
+drop index if exists idx_news_0;  -- replaced by indexes of utils.prepare_news_storage, they need last_seen
 
 create view if not exists news_view
 as
@@ -103,9 +441,9 @@ where inserted_timestamp in (
     group by squad_id)
 group by squad_id;
 
-create index if not exists idx_squads_states_0 on squads_states (squad_id);
+drop view if exists squads_view_2;  -- old definition scans squads_states
 
-create view if not exists squads_view_2
+create view squads_view_2
 as
 select squad_id,
 name,
@@ -143,17 +481,108 @@ current_season_powerplay_score,
 previous_season_powerplay_score,
 current_season_aegis_score,
 previous_season_aegis_score,
-current_season_trade_score +
-current_season_combat_score +
-current_season_exploration_score +
-current_season_cqc_score +
-current_season_bgs_score +
-current_season_powerplay_score +
-current_season_aegis_score as current_season_score,
-previous_season_trade_score +
-previous_season_combat_score +
-previous_season_exploration_score +
-previous_season_cqc_score +
-previous_season_bgs_score +
-previous_season_powerplay_score +
-previous_season_aegis_score as previous_season_score, max(inserted_timestamp) as inserted_timestamp from squads_states group by squad_id having tag is not null;
\ No newline at end of file
+current_season_score,
+previous_season_score,
+inserted_timestamp
+from squads_current;
+
+create table if not exists squads_refresh (
+squad_id int primary key,
+change_score real not null,  -- 0..1, moving average of "something changed on refresh"
+next_due datetime not null,
+updated_timestamp datetime default current_timestamp);
+
+create index if not exists idx_squads_refresh_0 on squads_refresh (next_due);
+
+create table if not exists squads_last_checked (
+squad_id int primary key,
+checked_timestamp datetime not null);  -- the last refresh of squad, even if it didn't change squads_states
+
+create index if not exists idx_squads_last_checked_0 on squads_last_checked (checked_timestamp);
+
+-- inserted_timestamp of squads_current (and squads_view) is time of the last refresh, as it was when every refresh
+-- inserted a squads_states row: with JUBILANT_CHANGE_ONLY_STATES=true unchanged state isn't inserted
+create trigger if not exists squads_last_checked_insert_to_current after insert on squads_last_checked
+begin
+    update squads_current set inserted_timestamp = new.checked_timestamp where squad_id = new.squad_id;
+end;
+
+create trigger if not exists squads_last_checked_update_to_current after update on squads_last_checked
+begin
+    update squads_current set inserted_timestamp = new.checked_timestamp where squad_id = new.squad_id;
+end;
+
+create table if not exists discover_checkpoint (
+id int primary key check (id = 0),  -- only one checkpoint
+cursor int not null,  -- the last processed id
+tries int not null,  -- consecutive misses
+failed text not null,  -- json list of missed ids which will be deleted once we find an existing squad after them
+updated_timestamp datetime default current_timestamp);
+
+-- discord notifications to send, written by hooks in the same transaction as squad's data and deleted by
+-- discord_outbox.DiscordSender once delivered
+create table if not exists discord_outbox (
+message_id integer primary key,
+content text not null,  -- not longer than discord's limit, see discord_outbox.split_message
+attempts int not null default 0,  -- failed deliveries
+created_timestamp datetime default current_timestamp);
+
+-- where archive.py moved rows of a squad: one row per squad per compressed member of archive file
+create table if not exists archive_index (
+table_name text not null,  -- squads_states or news
+squad_id int not null,
+archive_file text not null,  -- relative to JUBILANT_ARCHIVE_DIR
+member_offset int not null,  -- gzip member with the rows
+member_length int not null,
+primary key (table_name, squad_id, archive_file, member_offset));
+
+-- contiguous ranges of ids we have any squads_states row for (existing and deleted squads), maintained by
+-- squads_states_to_known_id_ranges trigger, so the first hole and the last known id don't need a squads_states scan
+create table if not exists known_id_ranges (
+range_start int primary key,
+range_end int not null);
+
+create index if not exists idx_known_id_ranges_0 on known_id_ranges (range_end);
+
+create trigger if not exists squads_states_to_known_id_ranges instead of insert on squads_states
+when coalesce((select range_end from known_id_ranges where range_start <= new.squad_id
+    order by range_start desc limit 1), new.squad_id - 1) < new.squad_id  -- only ids we didn't know before
+begin
+    -- extend the range which ends right before the new id, up to the end of the next range if they touch now
+    update known_id_ranges
+    set range_end = coalesce((select range_end from known_id_ranges where range_start = new.squad_id + 1), new.squad_id)
+    where range_end = new.squad_id - 1;
+
+    -- the next range was merged into the previous one
+    delete from known_id_ranges
+    where range_start = new.squad_id + 1 and exists (select * from known_id_ranges as merged
+        where merged.range_end = known_id_ranges.range_end and merged.range_start < new.squad_id);
+
+    -- the next range wasn't merged, extend it down
+    update known_id_ranges set range_start = new.squad_id where range_start = new.squad_id + 1;
+
+    -- neither of ranges is adjacent, the new id is a range itself
+    insert into known_id_ranges (range_start, range_end)
+    select new.squad_id, new.squad_id
+    where coalesce((select range_end from known_id_ranges where range_start <= new.squad_id
+        order by range_start desc limit 1), new.squad_id - 1) < new.squad_id;
+end;
+
+-- fills known_id_ranges of DBs created before it, only once
+insert into known_id_ranges (range_start, range_end)
+select min(squad_id), max(squad_id)
+from (select squad_id, squad_id - row_number() over (order by squad_id) as island
+    from (select distinct squad_id from squads_states
+        -- `where not exists` doesn't stop the scan, limit 0 does
+        limit case when exists (select * from known_id_ranges) then 0 else -1 end))
+group by island;
+
+-- every existing squad has squads_last_checked and squads_refresh rows, so update modes take squads in index order,
+-- store_squad_info keeps them, these fill the ones of squads stored before the tables were added
+insert or ignore into squads_last_checked (squad_id, checked_timestamp)
+select squad_id, inserted_timestamp
+from squads_current;
+
+insert or ignore into squads_refresh (squad_id, change_score, next_due)
+select squads_last_checked.squad_id, 0.5, squads_last_checked.checked_timestamp
+from squads_last_checked inner join squads_current on squads_last_checked.squad_id = squads_current.squad_id;
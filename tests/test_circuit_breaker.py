@@ -0,0 +1,91 @@
+"""
+Tests of circuit_breaker.MaintenanceCircuitBreaker
+
+Usage (from repository root):
+    python -m unittest discover tests
+"""
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import circuit_breaker  # noqa: E402
+
+
+class FakeFAPI:
+    def __init__(self):
+        self.on_maintenance: bool = True
+        self.probes: int = 0
+
+    def probe(self) -> bool:
+        self.probes += 1
+        return not self.on_maintenance
+
+
+@mock.patch.object(circuit_breaker, 'MAINTENANCE_PROBE_INTERVAL', 0.1)
+@mock.patch.object(circuit_breaker, 'MAINTENANCE_MAX_PROBE_INTERVAL', 0.1)
+@mock.patch.object(circuit_breaker, 'MAINTENANCE_MAX_WAIT', 0.3)
+class TestMaintenanceCircuitBreaker(unittest.TestCase):
+    def make_breaker(self) -> tuple[circuit_breaker.MaintenanceCircuitBreaker, FakeFAPI]:
+        fapi = FakeFAPI()
+        breaker = circuit_breaker.MaintenanceCircuitBreaker(fapi.probe)
+        breaker._probe_interval = circuit_breaker.MAINTENANCE_PROBE_INTERVAL  # default was taken on import
+        return breaker, fapi
+
+    def test_closed_circuit_does_not_wait(self):
+        breaker, fapi = self.make_breaker()
+        breaker.wait_closed()
+        self.assertEqual(fapi.probes, 0)
+
+    def test_closes_when_probe_passes(self):
+        breaker, fapi = self.make_breaker()
+        breaker.trip()
+        fapi.on_maintenance = False
+
+        breaker.wait_closed()
+        self.assertFalse(breaker.is_open)
+        self.assertEqual(fapi.probes, 1)
+
+    def test_max_wait_limits_every_call(self):
+        breaker, fapi = self.make_breaker()
+        breaker.trip()
+
+        for _ in range(2):
+            started: float = time.monotonic()
+            with self.assertRaises(circuit_breaker.CircuitOpen):
+                breaker.wait_closed()
+
+            # the second call waits too instead of raising at once because maintenance is older than max wait
+            self.assertGreaterEqual(time.monotonic() - started, circuit_breaker.MAINTENANCE_MAX_WAIT)
+
+        self.assertTrue(breaker.is_open)
+
+    def test_recovers_after_max_wait(self):
+        breaker, fapi = self.make_breaker()
+        breaker.trip()
+
+        with self.assertRaises(circuit_breaker.CircuitOpen):
+            breaker.wait_closed()
+
+        probes_before: int = fapi.probes
+        fapi.on_maintenance = False
+        time.sleep(circuit_breaker.MAINTENANCE_PROBE_INTERVAL)
+
+        breaker.wait_closed()  # probes and closes instead of raising
+        self.assertFalse(breaker.is_open)
+        self.assertGreater(fapi.probes, probes_before)
+
+    def test_abort(self):
+        breaker, fapi = self.make_breaker()
+        breaker.trip()
+        breaker.abort()
+
+        with self.assertRaises(circuit_breaker.CircuitOpen):
+            breaker.wait_closed()
+
+
+if __name__ == '__main__':
+    unittest.main()
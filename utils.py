@@ -1,20 +1,31 @@
+import concurrent.futures
+import functools
 import json
 import os
 import sqlite3
 import time
-from typing import Union
+from typing import Callable, Union
 
 import requests
 
+import bearer
+import circuit_breaker
+import db_writer
+import discord_outbox
 import hooks
+import id_index
+import proxy_scheduler
+import refresh_scheduler
+import sessions
 import sql_requests
 from EDMCLogging import get_main_logger
 
 logger = get_main_logger()
 
-BASE_URL = 'https://api.orerve.net/2.0/website/squadron/'
+BASE_URL = os.getenv('JUBILANT_FAPI_BASE_URL', 'https://api.orerve.net/2.0/website/squadron/')
 INFO_ENDPOINT = 'info'
 NEWS_ENDPOINT = 'news/list'
+TOKEN_URL = os.getenv('JUBILANT_TOKEN_URL', 'https://capi.demb.design/random_token')
 
 TIME_BETWEEN_REQUESTS: float = 3.0
 if os.getenv("JUBILANT_TIME_BETWEEN_REQUESTS") is not None:
@@ -27,6 +38,19 @@ if os.getenv("JUBILANT_TIME_BETWEEN_REQUESTS") is not None:
 
 logger.debug(f'TIME_BETWEEN_REQUESTS = {TIME_BETWEEN_REQUESTS} {type(TIME_BETWEEN_REQUESTS)}')
 
+SMART_NEWS: bool = os.getenv('JUBILANT_SMART_NEWS', 'false').lower() == 'true'
+NEWS_MAX_AGE: float = float(os.getenv('JUBILANT_NEWS_MAX_AGE', 24 * 60 * 60))
+
+logger.debug(f'SMART_NEWS = {SMART_NEWS}, NEWS_MAX_AGE = {NEWS_MAX_AGE}')
+
+DISCOVER_CHECKPOINT_INTERVAL: float = float(os.getenv('JUBILANT_DISCOVER_CHECKPOINT_INTERVAL', 30))
+# insert squads_states row only if state differs from the last stored one, squads_last_checked keeps refresh time
+CHANGE_ONLY_STATES: bool = os.getenv('JUBILANT_CHANGE_ONLY_STATES', 'false').lower() == 'true'
+
+logger.debug(f'CHANGE_ONLY_STATES = {CHANGE_ONLY_STATES}')
+
+MAINTENANCE_PROBE_SQUAD_ID: int = int(os.getenv('JUBILANT_MAINTENANCE_PROBE_SQUAD_ID', 1))
+
 
 with open('available.json', 'r', encoding='utf-8') as available_file:
     TAG_COLLECTIONS: dict = json.load(available_file)['SquadronTagData']['SquadronTagCollections']
@@ -40,6 +64,24 @@ except FileNotFoundError:
     PROXIES_DICT: list[dict] = [{'url': None, 'last_try': 0}]
 
 
+SESSION_POOL = sessions.SessionPool()
+PROXY_SCHEDULER = proxy_scheduler.ProxyScheduler(PROXIES_DICT, TIME_BETWEEN_REQUESTS)
+DB_WRITER = db_writer.BatchedWriter()
+WRITER = db_writer.WriterThread()
+DISCORD_SENDER = discord_outbox.DiscordSender(WRITER, DB_WRITER)
+_NEWS_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=len(PROXIES_DICT), thread_name_prefix='news')
+
+
+def on_writer(function: Callable) -> Callable:
+    """Decorator for functions which use collector's connection: they are executed by WRITER thread, see db_writer.py"""
+
+    @functools.wraps(function)
+    def decorated(*args, **kwargs):
+        return WRITER.call(function, *args, **kwargs)
+
+    return decorated
+
+
 class FAPIDownForMaintenance(Exception):
     pass
 
@@ -48,82 +90,126 @@ class FAPIUnknownStatusCode(Exception):
     pass
 
 
-def proxied_request(url: str, method: str = 'get', **kwargs) -> requests.Response:
-    """Makes request through one of proxies in round robin manner, respects fdev request kd for every proxy
+def proxied_request(
+        url: str,
+        method: str = 'get',
+        proxy: dict = None,
+        maintenance_probe: bool = False,
+        **kwargs) -> requests.Response:
+    """Makes request through one of proxies, respects fdev request kd for every proxy
 
     :param url: url to request
     :param method: method to use in request
+    :param proxy: entry of PROXIES_DICT to use, if None then the earliest eligible proxy will be selected, if
+    pinned proxy fails, the request is retried through any other proxy
+    :param maintenance_probe: request is CIRCUIT_BREAKER's probe, it bypasses the breaker and raises on 418
     :param kwargs: kwargs
     :return: requests.Response object
 
-    detect oldest used proxy
-    if selected proxy is banned, then switch to next
-    detect how many we have to sleep to respect it 3 sec timeout for each proxy
-    sleep it
+    take the earliest eligible proxy from PROXY_SCHEDULER, it sleeps for us to respect 3 sec timeout for each proxy
+    and skips banned (quarantined) proxies
     perform request with it
-    if request failed -> write last_try for current proxy and try next proxy
+    if request failed -> report failure to scheduler, it backoffs the proxy, and try next proxy
+    if FAPI rejected bearer token (401, 403) -> drop token from cache and try again with another one
+    if FAPI is on maintenance (418) -> open CIRCUIT_BREAKER, wait until FAPI is back and try again
     """
 
-    global PROXIES_DICT
+    auth_tries: int = 0
+    timeout = kwargs.pop('timeout', SESSION_POOL.timeout)
 
     while True:
 
-        selected_proxy = min(PROXIES_DICT, key=lambda x: x['last_try'])
-        logger.debug(f'Requesting {method.upper()} {url!r}, kwargs: {kwargs}; Using {selected_proxy["url"]} proxy')
+        if not maintenance_probe:
+            try:
+                CIRCUIT_BREAKER.wait_closed()
 
-        # let's detect how much we have to wait
-        time_to_sleep: float = (selected_proxy['last_try'] + TIME_BETWEEN_REQUESTS) - time.time()
+            except circuit_breaker.CircuitOpen as e:
+                raise FAPIDownForMaintenance(str(e)) from e
 
-        if 0 < time_to_sleep <= TIME_BETWEEN_REQUESTS:
-            logger.debug(f'Sleeping {time_to_sleep} s')
-            time.sleep(time_to_sleep)
+        selected_proxy: proxy_scheduler.ProxyState = PROXY_SCHEDULER.acquire(proxy)
+        logger.debug(f'Requesting {method.upper()} {url!r}, kwargs: {kwargs}; Using {selected_proxy.url} proxy')
 
-        if selected_proxy['url'] is None:
-            proxies: dict = None  # noqa
+        bearer_token: str = BEARER_CACHE.get()
+        request_start: float = time.time()
 
-        else:
-            proxies: dict = {'https': selected_proxy['url']}
+        # per request proxies take precedence over HTTP(S)_PROXY envs, session level ones don't
+        proxies: Union[dict, None] = None if selected_proxy.url is None else {'https': selected_proxy.url}
 
         try:
-            proxiedFapiRequest: requests.Response = requests.request(
+            # session keeps alive connection through selected proxy
+            proxiedFapiRequest: requests.Response = SESSION_POOL.get(selected_proxy.url).request(
                 method=method,
                 url=url,
+                headers={'Authorization': f'Bearer {bearer_token}'},
                 proxies=proxies,
-                headers={'Authorization': f'Bearer {_get_bearer()}'},
+                timeout=timeout,
                 **kwargs
             )
 
             logger.debug(f'Request complete, code {proxiedFapiRequest.status_code!r}, len '
                          f'{len(proxiedFapiRequest.content)}')
 
-        except requests.exceptions.ConnectionError as e:
-            logger.error(f'Proxy {selected_proxy["url"]} is invalid: {str(e.__class__.__name__)}')
-            selected_proxy['last_try'] = time.time()  # because link, lol
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            logger.error(f'Proxy {selected_proxy.url} is invalid: {str(e.__class__.__name__)}')
+            SESSION_POOL.report_failure(selected_proxy.url)
+            PROXY_SCHEDULER.release(selected_proxy, success=False)
+            proxy = None  # don't wait for backoff of pinned proxy, any other will do
             continue
 
-        selected_proxy['last_try'] = time.time()  # because link, lol
+        SESSION_POOL.report_success(selected_proxy.url)
+        PROXY_SCHEDULER.release(selected_proxy, success=True, latency=time.time() - request_start)
 
         if proxiedFapiRequest.status_code == 418:  # FAPI is on maintenance
             logger.warning(f'{method.upper()} {proxiedFapiRequest.url} returned 418, content dump:\n'
                            f'{proxiedFapiRequest.content}')
 
-            raise FAPIDownForMaintenance
+            if maintenance_probe:
+                raise FAPIDownForMaintenance
+
+            CIRCUIT_BREAKER.trip()
+            continue
+
+        elif proxiedFapiRequest.status_code in (401, 403) and auth_tries < BEARER_CACHE.pool_size:
+            logger.warning(f'{method.upper()} {proxiedFapiRequest.url} returned {proxiedFapiRequest.status_code}, '
+                           f'dropping bearer token')
+            BEARER_CACHE.invalidate(bearer_token)
+            auth_tries += 1
+            continue
 
         elif proxiedFapiRequest.status_code != 200:
-            logger.warning(f"Request to {method.upper()} {url!r} with kwargs: {kwargs}, using {selected_proxy['url']} "
+            logger.warning(f"Request to {method.upper()} {url!r} with kwargs: {kwargs}, using {selected_proxy.url} "
                            f"proxy ends with {proxiedFapiRequest.status_code} status code, content: "
                            f"{proxiedFapiRequest.content}")
 
         return proxiedFapiRequest
 
 
+def _maintenance_probe() -> bool:
+    """Cheap request to check if FAPI is back after maintenance, see CIRCUIT_BREAKER
+
+    :return: True if FAPI isn't on maintenance
+    """
+
+    try:
+        proxied_request(
+            BASE_URL + INFO_ENDPOINT, maintenance_probe=True, params={'squadronId': MAINTENANCE_PROBE_SQUAD_ID})
+
+    except FAPIDownForMaintenance:
+        return False
+
+    return True
+
+
+CIRCUIT_BREAKER = circuit_breaker.MaintenanceCircuitBreaker(_maintenance_probe)
+
+
 def _get_bearer() -> str:
     """Gets bearer token from capi.demb.design (companion-api project)
 
     :return: bearer token as str
     """
     bearer_request: requests.Response = requests.get(
-        url='https://capi.demb.design/random_token', headers={'auth': os.environ['DEMB_CAPI_AUTH']})
+        url=TOKEN_URL, headers={'auth': os.environ['DEMB_CAPI_AUTH']})
 
     try:
         bearer: str = bearer_request.json()['access_token']
@@ -136,61 +222,46 @@ def _get_bearer() -> str:
     return bearer
 
 
+BEARER_CACHE = bearer.BearerCache(_get_bearer)
+
+
 def fdev2people(hex_str: str) -> str:
     """Converts string with hex chars to string"""
     return bytes.fromhex(hex_str).decode('utf-8')
 
 
-def notify_discord(message: str) -> None:
-    """Just sends message to discord, without rate limits respect"""
-    logger.debug('Sending discord message')
-
-    if len(message) >= 2000:  # discord limitation
-        logger.warning(f'Refuse to send len={len(message)}, content dump:\n{message}')
-        message = 'Len > 2000, check logs'
-
-    hookURL: str = os.environ['DISCORD_NOTIFICATIONS_HOOK']
-    content: bytes = f'content={requests.utils.quote(message)}'.encode('utf-8')
-
-    discord_request: requests.Response = requests.post(
-        url=hookURL,
-        data=content,
-        headers={'Content-Type': 'application/x-www-form-urlencoded'}
-    )
-
-    try:
-        discord_request.raise_for_status()
+def notify_discord(message: str, db_conn: sqlite3.Connection) -> None:
+    """Puts message to discord outbox, DISCORD_SENDER delivers it after commit, see discord_outbox.py
 
-    except Exception as e:
-        logger.exception(f'Fail on sending message to discord ({"/".join(hookURL.split("/")[-2:])})'
-                         f'\n{discord_request.content}', exc_info=e)
-        return
+    :param message:
+    :param db_conn: connection of the hook, message is committed together with its transaction
+    :return:
+    """
 
-    logger.debug('Sending successful')
-    return
+    discord_outbox.enqueue(message, db_conn)
 
 
-def _update_squad_news(squad_id: int, db_conn: sqlite3.Connection) -> Union[bool, str]:
+def _update_squad_news(squad_id: int, news_request: requests.Response, db_conn: sqlite3.Connection) -> Union[bool, str]:
     """Update news for squad with specified ID
 
     :param squad_id: id of squad to insert news
-    :param db_conn: connection to sqlite DB
+    :param news_request: already performed news request, see fetch_squad_info
+    :param db_conn: connection to sqlite DB, must be in transaction
     :return: motd if squad exists, False if not
     :rtype: bool, str
     """
 
     """
     How it should works?
-    Request news
+    Take requested news
     if squad doesn't exists
         return False
     
     else
-        insert all news even if it already exist in DB
+        insert news, if news storage is deduplicated, already known news only get last_seen updated
         return motd
     """
 
-    news_request: requests.Response = proxied_request(BASE_URL + NEWS_ENDPOINT, params={'squadronId': squad_id})
     if news_request.status_code != 200:  # must not happen
         logger.warning(f'Got not 200 status code on requesting news, content: {news_request.content}, '
                        f'code: {news_request.status_code}')
@@ -209,46 +280,341 @@ def _update_squad_news(squad_id: int, db_conn: sqlite3.Connection) -> Union[bool
     else:  # squadron exists FDEV
         del squad_news['id']
 
+        news_rows: list[tuple] = list()
         for type_of_news_key in squad_news:
             one_type_of_news: list = squad_news[type_of_news_key]
 
             if len(squad_news[type_of_news_key]) == 0:
                 logger.debug(f'squad_news[{type_of_news_key}] len == 0 for {squad_id}')
-
-                with db_conn:
-                    db_conn.execute(
-                        sql_requests.insert_news,
-                        (
-                            squad_id,
-                            type_of_news_key,
-                            *[None for i in range(0, 10)]
-                        )
-                    )
+                news_rows.append((squad_id, type_of_news_key, *[None for i in range(0, 10)]))
 
             news: dict
             for news in one_type_of_news:
-                with db_conn:
-                    db_conn.execute(
-                        sql_requests.insert_news,
-                        (
-                            squad_id,
-                            type_of_news_key,
-                            news.get('id'),
-                            news.get('date'),
-                            news.get('category'),
-                            news.get('activity'),
-                            news.get('season'),
-                            news.get('bookmark'),
-                            news.get('motd'),
-                            news.get('author'),
-                            news.get('cmdr_id'),
-                            news.get('user_id')
-                        )
+                news_rows.append(
+                    (
+                        squad_id,
+                        type_of_news_key,
+                        news.get('id'),
+                        news.get('date'),
+                        news.get('category'),
+                        news.get('activity'),
+                        news.get('season'),
+                        news.get('bookmark'),
+                        news.get('motd'),
+                        news.get('author'),
+                        news.get('cmdr_id'),
+                        news.get('user_id')
                     )
+                )
+
+        # caller's transaction (see store_squad_info) commits it together with the state
+        if is_news_storage_deduplicated(db_conn):
+            db_conn.executemany(sql_requests.upsert_news, news_rows)
+
+        else:
+            db_conn.executemany(sql_requests.insert_news, news_rows)
 
         return next(iter(squad_news['public_statements']), dict()).get('motd', '')
 
 
+def is_news_storage_deduplicated(db_conn: sqlite3.Connection) -> bool:
+    return db_conn.execute(sql_requests.check_news_unique_index).fetchone()[0] == 1
+
+
+def prepare_news_storage(db_conn: sqlite3.Connection) -> None:
+    """Migrates news table of old DBs: adds last_seen column, indexes and unique index on news. Unique index can't
+    be created if there are duplicates already, then news are stored without deduplication until `main.py compact news`
+
+    :param db_conn:
+    :return:
+    """
+
+    columns: list[str] = [row[1] for row in db_conn.execute(sql_requests.select_news_columns)]
+    with db_conn:
+        if 'last_seen' not in columns:
+            logger.info('Adding last_seen column to news')
+            db_conn.execute(sql_requests.add_news_last_seen)
+
+    db_conn.executescript(sql_requests.create_news_indexes)
+
+    try:
+        with db_conn:
+            db_conn.execute(sql_requests.create_news_unique_index)
+
+    except sqlite3.IntegrityError:
+        logger.warning('news table has duplicates, news are stored without deduplication, '
+                       'run `main.py compact news` to fix it')
+
+
+def detach_legacy_squads_states(db_conn: sqlite3.Connection) -> None:
+    """squads_states of old DBs is a table, not a view over dictionary encoded squads_states_data. Renames it to
+    squads_states_legacy, so sql_schema.sql can create the view, should be called before the schema
+
+    :param db_conn:
+    :return:
+    """
+
+    row: Union[tuple, None] = db_conn.execute(sql_requests.select_squads_states_type).fetchone()
+    if row is not None and row[0] == 'table':
+        logger.info('Renaming squads_states table to squads_states_legacy')
+        db_conn.executescript(sql_requests.rename_legacy_squads_states)
+
+
+def encode_legacy_squads_states(db_conn: sqlite3.Connection) -> bool:
+    """Moves rows of squads_states_legacy to squads_states_data, should be called after the schema
+
+    :param db_conn:
+    :return: if there was something to move
+    """
+
+    if db_conn.execute(sql_requests.check_legacy_squads_states).fetchone()[0] == 0:
+        return False
+
+    logger.info('Moving squads_states_legacy rows to dictionary encoded squads_states_data, it can take a while')
+    db_conn.executescript(sql_requests.encode_legacy_squads_states)  # it's a transaction by itself
+    logger.info('squads_states rows moved, `main.py compact states` vacuums DB to give the space back')
+    return True
+
+
+@on_writer
+def compact_news(db_conn: sqlite3.Connection) -> int:
+    """Deletes duplicates of news, keeping the first row of every news with the last time it was seen, and
+    enables deduplication of news
+
+    :param db_conn:
+    :return: amount of deleted rows
+    """
+
+    rows_before: int = db_conn.execute(sql_requests.select_news_count).fetchone()[0]
+    db_conn.executescript(sql_requests.compact_news)  # it's a transaction by itself
+
+    prepare_news_storage(db_conn)
+    db_conn.execute(sql_requests.vacuum)
+
+    return rows_before - db_conn.execute(sql_requests.select_news_count).fetchone()[0]
+
+
+@on_writer
+def fetch_all(db_conn: sqlite3.Connection, query: str, parameters: tuple = ()) -> list:
+    """Runs read query on collector's connection, for callers out of WRITER thread
+
+    :param db_conn:
+    :param query:
+    :param parameters:
+    :return: all rows
+    """
+
+    return db_conn.execute(query, parameters).fetchall()
+
+
+@on_writer
+def is_squad_properly_deleted(squad_id: int, db_conn: sqlite3.Connection) -> bool:
+    """Checks if we already have squad as properly deleted in our DB
+
+    :param squad_id:
+    :param db_conn:
+    :return:
+    """
+
+    return id_index.get(db_conn).is_deleted(squad_id)
+
+
+def _squad_state_row(squad_id: int, squad_request_json: dict) -> tuple:
+    """Makes squads_states row (in insert_squad_states order) from FDEV info dict with normalized ownerName
+
+    :param squad_id:
+    :param squad_request_json:
+    :return:
+    """
+
+    return (
+        squad_id,
+        squad_request_json['name'],
+        squad_request_json['tag'],
+        squad_request_json['ownerName'],
+        squad_request_json['ownerId'],
+        squad_request_json['platform'],
+        squad_request_json['created'],
+        squad_request_json['created_ts'],
+        squad_request_json['acceptingNewMembers'],
+        squad_request_json['powerId'],
+        squad_request_json['powerName'],
+        squad_request_json['superpowerId'],
+        squad_request_json['superpowerName'],
+        squad_request_json['factionId'],
+        squad_request_json['factionName'],
+        json.dumps(squad_request_json['userTags']),
+        squad_request_json['memberCount'],
+        squad_request_json['pendingCount'],
+        squad_request_json['full'],
+        squad_request_json['publicComms'],
+        squad_request_json['publicCommsOverride'],
+        squad_request_json['publicCommsAvailable'],
+        squad_request_json['current_season_trade_score'],
+        squad_request_json['previous_season_trade_score'],
+        squad_request_json['current_season_combat_score'],
+        squad_request_json['previous_season_combat_score'],
+        squad_request_json['current_season_exploration_score'],
+        squad_request_json['previous_season_exploration_score'],
+        squad_request_json['current_season_cqc_score'],
+        squad_request_json['previous_season_cqc_score'],
+        squad_request_json['current_season_bgs_score'],
+        squad_request_json['previous_season_bgs_score'],
+        squad_request_json['current_season_powerplay_score'],
+        squad_request_json['previous_season_powerplay_score'],
+        squad_request_json['current_season_aegis_score'],
+        squad_request_json['previous_season_aegis_score']
+    )
+
+
+@on_writer
+def get_smart_news_state(squad_id: int, db_conn: sqlite3.Connection) -> Union[tuple, None]:
+    """Returns last stored state of squad if smart news enabled and stored news of the squad are younger than
+    NEWS_MAX_AGE, i.e. if news request can be skipped when the state didn't change
+
+    :param squad_id:
+    :param db_conn:
+    :return: last squads_states row or None if news have to be requested anyway
+    """
+
+    if not SMART_NEWS:
+        return None
+
+    news_age: Union[float, None] = db_conn.execute(sql_requests.select_news_age, (squad_id,)).fetchone()[0]
+    if news_age is None or news_age > NEWS_MAX_AGE:
+        return None
+
+    return db_conn.execute(sql_requests.select_last_squad_state, (squad_id,)).fetchone()
+
+
+def get_last_motd(squad_id: int, db_conn: sqlite3.Connection) -> str:
+    sql_req = db_conn.execute(sql_requests.select_last_motd, (squad_id,)).fetchone()
+    if sql_req is None or sql_req[0] is None:
+        return ''
+
+    return sql_req[0]
+
+
+def fetch_squad_info(
+        squad_id: int,
+        proxy: dict = None,
+        parallel: bool = False,
+        previous_state: tuple = None) -> tuple[requests.Response, Union[requests.Response, None]]:
+    """Network stage of update_squad_info: requests info and, if squad exists FDEV, news. Doesn't touch DB,
+    so it's safe to call it from any thread
+
+    :param squad_id: id of squad to request
+    :param proxy: entry of PROXIES_DICT to perform info request through, None for any
+    :param parallel: request news at the same time as info, through another proxy. It's a waste of request if
+    squad doesn't exist, so use it only for squads we expect to exist
+    :param previous_state: result of get_smart_news_state, if info gives the same state, news aren't requested.
+    Requires to see info first, so news are never requested in parallel with it
+    :return: info response and news response (None if squad doesn't exists FDEV or news were skipped)
+    """
+
+    if previous_state is not None:
+        parallel = False
+
+    if parallel:
+        # scheduler gives concurrent requests different proxies, so it costs one kd instead of two
+        news_future: concurrent.futures.Future = _NEWS_EXECUTOR.submit(
+            proxied_request, BASE_URL + NEWS_ENDPOINT, params={'squadronId': squad_id})
+
+    squad_request: requests.Response = proxied_request(
+        BASE_URL + INFO_ENDPOINT, proxy=proxy, params={'squadronId': squad_id})
+
+    if squad_request.status_code != 200:
+        return squad_request, None
+
+    if parallel:
+        news_request: requests.Response = news_future.result()  # noqa
+
+    else:
+        if previous_state is not None:
+            squad_request_json: dict = squad_request.json()['squadron']
+            squad_request_json['ownerName'] = fdev2people(squad_request_json['ownerName'])
+
+            if _squad_state_row(squad_id, squad_request_json) == tuple(previous_state):
+                logger.debug(f'State of {squad_id} did not change, skipping news request')
+                return squad_request, None
+
+        news_request: requests.Response = proxied_request(
+            BASE_URL + NEWS_ENDPOINT, proxy=proxy, params={'squadronId': squad_id})
+
+    return squad_request, news_request
+
+
+@on_writer
+def store_squad_info(
+        squad_id: int,
+        squad_request: requests.Response,
+        news_request: Union[requests.Response, None],
+        db_conn: sqlite3.Connection,
+        suppress_absence: bool = False) -> Union[bool, dict]:
+    """DB stage of update_squad_info: writes results of fetch_squad_info to DB and calls hooks
+
+    :param squad_id: id of squad to update/insert
+    :param squad_request: info response
+    :param news_request: news response, None with 200 info response means news were skipped by smart news
+    :param db_conn: connection to sqlite DB
+    :param suppress_absence: if we shouldn't mark squad as deleted if we didn't found it by FDEV
+    :return: squad dict if squad exists, False if not
+    :rtype: bool, dict
+    """
+
+    if squad_request.status_code == 200:  # squad exists FDEV
+        squad_request_json: dict = squad_request.json()['squadron']
+        squad_request_json['ownerName'] = fdev2people(squad_request_json['ownerName'])  # normalize value
+
+        state_row: tuple = _squad_state_row(squad_id, squad_request_json)
+        previous_state: Union[tuple, None] = db_conn.execute(
+            sql_requests.select_last_squad_state, (squad_id,)).fetchone()
+        previous_motd: str = get_last_motd(squad_id, db_conn)
+
+        with DB_WRITER.transaction(db_conn):
+            if CHANGE_ONLY_STATES and previous_state is not None and tuple(previous_state) == state_row:
+                logger.debug(f'State of {squad_id} did not change, not inserting it')
+                squad_request_json.update(state_unchanged=True)
+
+            else:
+                db_conn.execute(sql_requests.insert_squad_states, state_row)
+
+            db_conn.execute(sql_requests.upsert_squad_last_checked, (squad_id,))
+
+            if news_request is None:  # news were skipped by smart news, squad's state didn't change
+                motd: str = previous_motd
+                squad_request_json.update(news_skipped=True)
+
+            else:
+                motd: str = _update_squad_news(squad_id, news_request, db_conn)  # can return bool but never should
+
+            squad_request_json.update(motd=motd, previous_motd=previous_motd)
+            refresh_scheduler.record_refresh(squad_id, previous_state, state_row, motd != previous_motd, db_conn)
+
+            state_change: hooks.StateChange = hooks.make_state_change(previous_state, previous_motd, state_row, motd)
+            hooks.notify_insert_data(squad_request_json, state_change, db_conn)  # call hook
+
+        id_index.get(db_conn).mark_known(squad_id)  # only once the squad's transaction succeeded
+        return squad_request_json
+
+    elif squad_request.status_code == 404:  # squad doesn't exists FDEV
+        if id_index.get(db_conn).is_known(squad_id):  # we have it in DB
+
+            if not is_squad_properly_deleted(squad_id, db_conn):
+                # we don't have it deleted in DB, let's fix it
+                properly_delete_squadron(squad_id, db_conn)
+
+        elif not suppress_absence:
+            # we don't have it in DB at all but let's mark it as deleted to avoid requests to FDEV about it in future
+            properly_delete_squadron(squad_id, db_conn)
+
+        return False  # squadron stop their existing or never exists... it doesn't exists anyway
+
+    else:  # any other codes (except 418, that one handles in authed_request), never should happen
+        logger.warning(f'Unknown squad info status_code: {squad_request.status_code}, content: {squad_request.content}')
+        raise FAPIUnknownStatusCode(f'Status code: {squad_request.status_code}, content: {squad_request.content}')
+
+
 def update_squad_info(squad_id: int, db_conn: sqlite3.Connection, suppress_absence: bool = False) -> Union[bool, dict]:
     """Update/insert information about squadron with specified id in our DB
 
@@ -284,89 +650,25 @@ def update_squad_info(squad_id: int, db_conn: sqlite3.Connection, suppress_absen
             
        return False
     *Should we return something more then just a bool, may be a message to notify_discord?
+    
+    Network part lives in fetch_squad_info, DB part in store_squad_info, so collector.py can run them separately
+    News are requested in parallel with info unless suppress_absence, i.e. unless squad may not exist
+    With smart news (JUBILANT_SMART_NEWS=true) news aren't requested at all if info gives the same state as the last
+    stored one, but not longer than JUBILANT_NEWS_MAX_AGE seconds since the last news request
     """
 
-    if db_conn.execute(sql_requests.check_if_we_already_deleted_squad_in_db, (squad_id,)).fetchone()[0] != 0:
+    if is_squad_properly_deleted(squad_id, db_conn):
         # we have it as properly deleted in our DB
         logger.debug(f'squad {squad_id} is marked as deleted in our DB, returning False')
         return False
 
-    squad_request: requests.Response = proxied_request(BASE_URL + INFO_ENDPOINT, params={'squadronId': squad_id})
+    squad_request, news_request = fetch_squad_info(
+        squad_id, parallel=not suppress_absence, previous_state=get_smart_news_state(squad_id, db_conn))
 
-    if squad_request.status_code == 200:  # squad exists FDEV
-        squad_request_json: dict = squad_request.json()['squadron']
-        squad_request_json['ownerName'] = fdev2people(squad_request_json['ownerName'])  # normalize value
-
-        with db_conn:
-            db_conn.execute(
-                sql_requests.insert_squad_states,
-                (
-                    squad_id,
-                    squad_request_json['name'],
-                    squad_request_json['tag'],
-                    squad_request_json['ownerName'],
-                    squad_request_json['ownerId'],
-                    squad_request_json['platform'],
-                    squad_request_json['created'],
-                    squad_request_json['created_ts'],
-                    squad_request_json['acceptingNewMembers'],
-                    squad_request_json['powerId'],
-                    squad_request_json['powerName'],
-                    squad_request_json['superpowerId'],
-                    squad_request_json['superpowerName'],
-                    squad_request_json['factionId'],
-                    squad_request_json['factionName'],
-                    json.dumps(squad_request_json['userTags']),
-                    squad_request_json['memberCount'],
-                    squad_request_json['pendingCount'],
-                    squad_request_json['full'],
-                    squad_request_json['publicComms'],
-                    squad_request_json['publicCommsOverride'],
-                    squad_request_json['publicCommsAvailable'],
-                    squad_request_json['current_season_trade_score'],
-                    squad_request_json['previous_season_trade_score'],
-                    squad_request_json['current_season_combat_score'],
-                    squad_request_json['previous_season_combat_score'],
-                    squad_request_json['current_season_exploration_score'],
-                    squad_request_json['previous_season_exploration_score'],
-                    squad_request_json['current_season_cqc_score'],
-                    squad_request_json['previous_season_cqc_score'],
-                    squad_request_json['current_season_bgs_score'],
-                    squad_request_json['previous_season_bgs_score'],
-                    squad_request_json['current_season_powerplay_score'],
-                    squad_request_json['previous_season_powerplay_score'],
-                    squad_request_json['current_season_aegis_score'],
-                    squad_request_json['previous_season_aegis_score']
-                )
-            )
-
-            motd: str = _update_squad_news(squad_id, db_conn)  # yeah, it can return bool but never should does it
-            squad_request_json.update(motd=motd)
-
-            hooks.notify_insert_data(squad_request_json, db_conn)  # call hook
-
-            return squad_request_json
-
-    elif squad_request.status_code == 404:  # squad doesn't exists FDEV
-        if db_conn.execute(
-                sql_requests.check_if_squad_exists_in_db,
-                (squad_id,)).fetchone()[0] > 0:  # we have it in DB
-
-            if db_conn.execute(sql_requests.check_if_we_already_deleted_squad_in_db, (squad_id,)).fetchone()[0] == 0:
-                # we don't have it deleted in DB, let's fix it
-                properly_delete_squadron(squad_id, db_conn)
-
-        elif not suppress_absence:
-            # we don't have it in DB at all but let's mark it as deleted to avoid requests to FDEV about it in future
-            properly_delete_squadron(squad_id, db_conn)
-
-        return False  # squadron stop their existing or never exists... it doesn't exists anyway
-
-    else:  # any other codes (except 418, that one handles in authed_request), never should happen
-        logger.warning(f'Unknown squad info status_code: {squad_request.status_code}, content: {squad_request.content}')
-        raise FAPIUnknownStatusCode(f'Status code: {squad_request.status_code}, content: {squad_request.content}')
+    return store_squad_info(squad_id, squad_request, news_request, db_conn, suppress_absence)
 
 
+@on_writer
 def properly_delete_squadron(squad_id: int, db_conn: sqlite3.Connection) -> None:
     """Properly deletes squadron from our DB
 
@@ -376,37 +678,97 @@ def properly_delete_squadron(squad_id: int, db_conn: sqlite3.Connection) -> None
     """
     logger.debug(f'Properly deleting {squad_id}')
 
-    hooks.notify_properly_delete(squad_id, db_conn)
-
-    with db_conn:
+    with DB_WRITER.transaction(db_conn):
+        hooks.notify_properly_delete(squad_id, db_conn)  # before the delete record, with hooks' notifications
         db_conn.execute(sql_requests.properly_delete_squad, (squad_id,))
 
+    id_index.get(db_conn).mark_deleted(squad_id)
+
 
+@on_writer
 def get_last_known_id(db_conn: sqlite3.Connection) -> int:
-    sql_request_result = db_conn.execute(sql_requests.select_last_known_id).fetchone()
-    if sql_request_result is None:
+    last_known: Union[int, None] = id_index.get(db_conn).last_known()
+    if last_known is None:
         logger.debug(f"Can't get last know id from DB, defaulting to 0")
         return 0
 
     else:
-        logger.debug(f'last know id from DB: {sql_request_result[0]}')
-        return sql_request_result[0]
+        logger.debug(f'last know id from DB: {last_known}')
+        return last_known
 
 
+@on_writer
 def get_next_hole_id_for_discover(db_conn: sqlite3.Connection) -> int:
     """Returns first unexisting id in DB
     :param db_conn:
     :return: last known id if we iterate from 1 to ...
     """
 
-    sql_req = db_conn.execute(sql_requests.select_first_hole_id).fetchone()
-    if sql_req is None:
+    first_hole: Union[int, None] = id_index.get(db_conn).first_hole()
+    if first_hole is None:
         logger.debug(f"Can't get last know id from DB, defaulting to 1")
         return 1
 
     else:
-        logger.debug(f'Next unknown id from DB: {sql_req[0]}')
-        return sql_req[0]
+        logger.debug(f'Next unknown id from DB: {first_hole}')
+        return first_hole
+
+
+@on_writer
+def load_discover_checkpoint(db_conn: sqlite3.Connection) -> Union[tuple[int, int, list[int]], None]:
+    """Returns progress of interrupted discover
+
+    :param db_conn:
+    :return: the last processed id, consecutive misses count, pending failed ids or None if there is no checkpoint
+    """
+
+    sql_req = db_conn.execute(sql_requests.select_discover_checkpoint).fetchone()
+    if sql_req is None:
+        return None
+
+    return sql_req[0], sql_req[1], json.loads(sql_req[2])
+
+
+@on_writer
+def save_discover_checkpoint(db_conn: sqlite3.Connection, cursor: int, tries: int, failed: list[int]) -> None:
+    logger.debug(f'Saving discover checkpoint: cursor {cursor}, tries {tries}, failed {len(failed)}')
+    with db_conn:
+        db_conn.execute(sql_requests.upsert_discover_checkpoint, (cursor, tries, json.dumps(failed)))
+
+
+@on_writer
+def clear_discover_checkpoint(db_conn: sqlite3.Connection) -> None:
+    with db_conn:
+        db_conn.execute(sql_requests.delete_discover_checkpoint)
+
+
+@on_writer
+def compact_squads_states(db_conn: sqlite3.Connection) -> int:
+    """Deletes squads_states rows which repeat the previous row of the same squad, so history keeps only changes.
+    Time of the last refresh is moved to squads_last_checked first. Makes sense with CHANGE_ONLY_STATES enabled
+
+    :param db_conn:
+    :return: amount of deleted rows
+    """
+
+    with db_conn:
+        db_conn.execute(sql_requests.backfill_squads_last_checked)
+
+    duplicates: list[tuple[int]] = list()
+    previous_row: Union[tuple, None] = None
+
+    for row in db_conn.execute(sql_requests.select_all_squad_states):
+        if previous_row is not None and previous_row == row[1:]:
+            duplicates.append((row[0],))
+
+        previous_row = row[1:]
+
+    logger.info(f'Deleting {len(duplicates)} repeating squads_states rows')
+    with db_conn:
+        db_conn.executemany(sql_requests.delete_squad_states_by_rowid, duplicates)
+
+    db_conn.execute(sql_requests.vacuum)
+    return len(duplicates)
 
 
 def resolve_user_tag(single_user_tag: int) -> [str, str]:
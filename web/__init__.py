@@ -66,6 +66,47 @@ class SquadsInfoByTag:
         resp.text = json.dumps(model_answer)
 
 
+class SquadsInfoByUserTags:
+    def on_get(self, req: falcon.request.Request, resp: falcon.response.Response, tag_ids: str,
+               details_type: str) -> None:
+        """
+        Params to request:
+        min_members: int - return only squads with at least that members
+        resolve_tags, pretty_keys, motd - as for SquadsInfoByTag
+
+        :param details_type: short or extended, extended includes tags
+        :param req:
+        :param resp:
+        :param tag_ids: comma separated user tags ids, squads must have all of them, i.e. 32 for russian squads
+        :return:
+        """
+
+        resp.content_type = falcon.MEDIA_JSON
+        details_type = details_type.lower()
+
+        motd: bool = req.params.get('motd', 'false').lower() == 'true'
+
+        if details_type not in ['short', 'extended']:
+            raise falcon.HTTPBadRequest(description=f'details_type must be one of short, extended')
+
+        try:
+            parsed_tag_ids: list[int] = [int(tag_id) for tag_id in tag_ids.split(',')]
+            min_members: int = int(req.params.get('min_members', 0))
+
+        except ValueError:
+            raise falcon.HTTPBadRequest(description=f'tag_ids must be comma separated integers, min_members integer')
+
+        extended = details_type == 'extended'
+
+        resolve_tags = req.params.get('resolve_tags', '').lower() == 'true'
+        pretty_keys = req.params.get('pretty_keys', 'true').lower() == 'true'
+
+        model_answer = model.list_squads_by_user_tags(
+            parsed_tag_ids, min_members, pretty_keys, motd, resolve_tags, extended)
+
+        resp.text = json.dumps(model_answer)
+
+
 class AppFixedLogging(falcon.App):
     def _python_error_handler(self, req: falcon.request.Request, resp: falcon.response.Response, error, params):
         logger.warning(f'failed on {req.method} {req.path}', exc_info=error)
@@ -77,6 +118,7 @@ application.add_route('/squads/now/by-tag/{details_type}/{tag}', SquadsInfoByTag
 
 application.add_route('/api/squads/now/by-tag/{details_type}/{tag}', SquadsInfoByTag(is_pattern=False))
 application.add_route('/api/squads/now/search/by-tag/{details_type}/{tag}', SquadsInfoByTag(is_pattern=True))
+application.add_route('/api/squads/now/by-user-tags/{details_type}/{tag_ids}', SquadsInfoByUserTags())
 
 if __name__ == '__main__':
     import waitress